@@ -66,6 +66,23 @@ def create_log(session: Session, content_type: str, content_excerpt: str, is_fla
     session.refresh(log_entry)
     return log_entry
 
+def create_logs_bulk(session: Session, entries: List[Dict[str, Any]]) -> int:
+    """Insert many ModerationLog rows in one commit. Each entry takes create_log's keyword arguments."""
+    logs = []
+    for entry in entries:
+        details = entry.get("details")
+        logs.append(ModerationLog(
+            content_type=entry["content_type"],
+            content_excerpt=entry.get("content_excerpt"),
+            is_flagged=entry.get("is_flagged", False),
+            details=json.dumps(details) if isinstance(details, (dict, list)) else str(details),
+            source=entry.get("source"),
+            original_language=entry.get("original_language")
+        ))
+    session.add_all(logs)
+    session.commit()
+    return len(logs)
+
 def get_logs(session: Session, limit: int = 50, offset: int = 0, content_type: Optional[str] = None) -> List[ModerationLog]:
     statement = select(ModerationLog)
     if content_type:
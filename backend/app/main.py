@@ -32,7 +32,24 @@ async def lifespan(app: FastAPI):
             print("MIGRATION SUCCESS: Added 'type' column to message table.")
         except Exception as e:
             print(f"MIGRATION INFO: Column 'type' likely exists or other error. {e}")
+
+        # AUTO-MIGRATION: MediaVerdict tables created before the unique index was declared
+        try:
+            from sqlalchemy import text
+            with engine.connect() as connection:
+                connection.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_mediaverdict_sha256_model ON mediaverdict (sha256, model_version)"))
+                connection.commit()
+        except Exception as e:
+            print(f"MIGRATION INFO: Could not add unique index to mediaverdict (duplicate rows?). {e}")
         
+        # Warm the shared blocklist so the first message doesn't pay for it
+        from app.services import blocklist_cache
+        blocklist_cache.refresh()
+
+        # Rebuild the near-duplicate index of reviewer-confirmed images
+        from app.services import bad_image_index
+        print(f"Bad image index: {bad_image_index.refresh()} hashes loaded.")
+
         # Initialize Firebase
         print("Initializing Firebase...")
         init_firebase()
@@ -40,7 +57,25 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"Error creating database tables: {e}")
         # Continue anyway so the app starts and can return JSON errors
+
+    # Background work gets its own guards: a failed migration or cache refresh above
+    # must not leave videos queued forever or models cold
+    try:
+        # Opt-in model preloading (MODEL_WARMUP), runs in the background; see /ready
+        from app.services import warmup
+        warmup.start_warmup()
+    except Exception as e:
+        print(f"Error starting model warm-up: {e}")
+
+    try:
+        # Background video moderation workers; re-queues jobs interrupted by a restart
+        from app.services import video_jobs
+        print(f"Video job workers: {video_jobs.start()} started.")
+    except Exception as e:
+        print(f"Error starting video job workers: {e}")
     yield
+    from app.services import video_jobs
+    video_jobs.stop()
 
 app = FastAPI(title="SafeChat360 Backend", lifespan=lifespan)
 
@@ -120,5 +155,13 @@ def read_root():
         "env_check": "DATABASE_URL found" if "postgres" in db_url else "WARNING: DATABASE_URL missing, using SQLite"
     }
 
+@app.get("/ready")
+def readiness_check():
+    """Load balancer readiness: 503 until every model in MODEL_WARMUP is warm (failed loads listed in "failed")"""
+    from fastapi.responses import JSONResponse
+    from app.services import warmup
+    status = warmup.readiness()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
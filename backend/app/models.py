@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
 from typing import Optional
 from datetime import datetime
 
@@ -59,6 +60,47 @@ class BlockedTerm(SQLModel, table=True):
     added_by: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class BlockedImageHash(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    dhash: str = Field(index=True)  # 64-bit hex
+    phash: Optional[str] = None
+    log_id: Optional[int] = None  # ModerationLog the reviewer confirmed
+    added_by: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class MediaVerdict(SQLModel, table=True):
+    # One verdict per (bytes, model config); concurrent writers race on this
+    __table_args__ = (Index("ux_mediaverdict_sha256_model", "sha256", "model_version", unique=True),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    sha256: str = Field(index=True)  # hex digest of the media bytes
+    kind: str  # image, video
+    model_version: str  # verdicts from other model configs don't apply
+    is_flagged: bool = False
+    result: str  # JSON of the moderation result
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class VideoJob(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job_id: str = Field(unique=True, index=True)  # public id (uuid4 hex)
+    status: str = Field(default="queued", index=True)  # queued, running, done, failed
+    stage: Optional[str] = None  # hashing, analyzing, saving
+    frames_scanned: int = 0
+    file_path: str  # upload kept on disk until the job finishes
+    sha256: Optional[str] = None  # computed while the upload streamed in
+    filename: Optional[str] = None
+    frame_interval: int = 2
+    source: Optional[str] = None  # uploader's email, as on ModerationLog
+    user_id: Optional[int] = Field(default=None, index=True)
+    attempts: int = 0
+    worker_id: Optional[str] = None  # host:pid of the process running it
+    heartbeat_at: Optional[datetime] = None
+    result: Optional[str] = None  # JSON of the moderation result
+    error: Optional[str] = None
+    log_id: Optional[int] = None  # ModerationLog written for the verdict
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 class Message(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     sender_id: int
@@ -4,6 +4,7 @@ from typing import List
 from app.db import get_session
 from app.models import BlockedTerm, User
 from app.deps import get_current_user
+from app.services import blocklist_cache
 
 router = APIRouter(prefix="/api/blocklist", tags=["blocklist"])
 
@@ -30,6 +31,7 @@ def add_blocked_term(
     session.add(blocked)
     session.commit()
     session.refresh(blocked)
+    blocklist_cache.invalidate()
     return blocked
 
 @router.delete("/{term_id}")
@@ -44,4 +46,5 @@ def delete_blocked_term(
         
     session.delete(term)
     session.commit()
+    blocklist_cache.invalidate()
     return {"status": "success", "message": "Term removed"}
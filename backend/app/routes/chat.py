@@ -9,6 +9,7 @@ from datetime import datetime
 from app.services.text_moderator import moderate_text
 from app.services.image_moderator import moderate_image_base64
 from app.services.ai_assistant import improve_text
+from app.services.workers import run_moderation, run_db, submit_db
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/api/chat", tags=["chat"]) # NOTE: Prefix was /chat in main.py, but for consistency with others /api/chat is better. 
@@ -127,6 +128,86 @@ def get_chat_history(
             
     return filtered_results[::-1] # Reverse for chronological
 
+def _log_moderation(content_type: str, content_excerpt: str, mod_result: Dict, user_id: int, original_language: str = "en"):
+    """Write a ModerationLog row in its own session (runs on the DB pool)"""
+    from app.db import engine
+    from app import crud
+    with Session(engine) as log_session:
+        crud.create_moderation_log(
+            log_session,
+            content_type=content_type,
+            content_excerpt=content_excerpt,
+            is_flagged=mod_result.get("is_flagged"),
+            details=str(mod_result),
+            source=str(user_id),
+            original_language=original_language
+        )
+
+def _save_call_log(user_id: int, sender_username: str, receiver_id: Optional[int], content: str) -> Dict:
+    """Persist a call start/end entry and return it in chat message shape"""
+    from app.db import engine
+    with Session(engine) as log_session:
+        log_msg = Message(
+            sender_id=user_id,
+            sender_username=sender_username,
+            receiver_id=receiver_id,
+            content=content,
+            type="call",
+            created_at=datetime.utcnow()
+        )
+        log_session.add(log_msg)
+        log_session.commit()
+        log_session.refresh(log_msg)
+        return {
+            "type": "message",
+            "id": log_msg.id,
+            "sender_id": log_msg.sender_id,
+            "sender_username": log_msg.sender_username,
+            "receiver_id": log_msg.receiver_id,
+            "content": log_msg.content,
+            "msg_type": "call", # Custom field for frontend distinction
+            "created_at": log_msg.created_at.isoformat()
+        }
+
+def _save_chat_message(user_id: int, sender_username: str, receiver_id: Optional[int], group_id: Optional[int], content: str, msg_type: str):
+    """Persist a chat message; returns (broadcast payload, group member ids or None)"""
+    from app.db import engine
+    from app.models import GroupMember
+
+    group_members = None
+    with Session(engine) as session:
+        if group_id:
+             # Get members
+             members = session.exec(select(GroupMember).where(GroupMember.group_id == group_id)).all()
+             group_members = [m.user_id for m in members]
+        
+        msg = Message(
+            sender_id=user_id,
+            sender_username=sender_username,
+            receiver_id=receiver_id,
+            group_id=group_id,
+            content=content,
+            type=msg_type,
+            created_at=datetime.utcnow()
+        )
+        session.add(msg)
+        session.commit()
+        session.refresh(msg)
+        
+        response = {
+            "type": "message", # Explicit type
+            "id": msg.id,
+            "sender_id": msg.sender_id,
+            "sender_username": msg.sender_username,
+            "receiver_id": msg.receiver_id,
+            "group_id": msg.group_id,
+            "content": msg.content,
+            "msg_type": msg.type,
+            "created_at": msg.created_at.isoformat()
+        }
+    return response, group_members
+
+
 @router.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str, token: str = None):
     print(f"WS: Connection attempt from client_id={client_id}, token={token}")
@@ -167,26 +248,24 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str, token: str =
                 continue
 
             # ------------------------------------------------------------------
-            # STRICT MODERATION CHECK (Blocking)
+            # STRICT MODERATION CHECK (Blocking for this connection only)
+            # Scans run on the moderation pool, so other sockets keep flowing;
+            # this loop awaits each one, which keeps per-connection ordering.
             # ------------------------------------------------------------------
             
              # 1. Text Moderation
             if content and not content.startswith(('data:image', 'data:video', 'data:audio')):
-                 mod_result = moderate_text(content)
+                 mod_result = await run_moderation(moderate_text, content)
                  
                  # Log it
-                 from app.db import engine
-                 from app import crud
-                 with Session(engine) as log_session:
-                     crud.create_moderation_log(
-                         log_session,
-                         content_type="text",
-                         content_excerpt=content,
-                         is_flagged=mod_result.get("is_flagged"),
-                         details=str(mod_result),
-                         source=str(user_id),
-                         original_language=mod_result.get("original_language", "en")
-                     )
+                 submit_db(
+                     _log_moderation,
+                     content_type="text",
+                     content_excerpt=content,
+                     mod_result=mod_result,
+                     user_id=user_id,
+                     original_language=mod_result.get("original_language", "en")
+                 )
 
                  if mod_result.get("is_flagged"):
                      reason = "Content Policy Violation"
@@ -207,20 +286,16 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str, token: str =
                  # Extract base64 part
                  try:
                      header, b64data = content.split(',', 1)
-                     img_mod_result = moderate_image_base64(b64data)
+                     img_mod_result = await run_moderation(moderate_image_base64, b64data)
                      
                      # Log it
-                     from app.db import engine
-                     from app import crud
-                     with Session(engine) as log_session:
-                         crud.create_moderation_log(
-                             log_session,
-                             content_type="image",
-                             content_excerpt="[Image]",
-                             is_flagged=img_mod_result.get("is_flagged"),
-                             details=str(img_mod_result),
-                             source=str(user_id)
-                         )
+                     submit_db(
+                         _log_moderation,
+                         content_type="image",
+                         content_excerpt="[Image]",
+                         mod_result=img_mod_result,
+                         user_id=user_id
+                     )
 
                      if img_mod_result.get("is_flagged"):
                          reason = "NSFW/Inappropriate Image detected"
@@ -240,10 +315,6 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str, token: str =
             # END MODERATION
             # ------------------------------------------------------------------
 
-            # Save to DB if it's a chat message
-            from app.db import engine
-            from app.models import GroupMember
-            
             # Signaling Messages (Don't save to DB)
             # Signaling Messages (Don't save to DB usually, enabling Logging for Start/End)
             msg_type = message_data.get("type")
@@ -258,110 +329,35 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str, token: str =
                      )
                  
                  # LOGGING: Intercept specific events to save to DB
-                 if msg_type == "answer":
-                      # Call Started
+                 if msg_type in ("answer", "hang-up"):
+                      # Call Started / Call Ended
+                      log_content = "Voice Call Started" if msg_type == "answer" else "Voice Call Ended"
                       try:
-                          with Session(engine) as log_session:
-                              log_msg = Message(
-                                  sender_id=user_id,
-                                  sender_username=sender_username,
-                                  receiver_id=receiver_id,
-                                  content="Voice Call Started",
-                                  type="call",
-                                  created_at=datetime.utcnow()
-                              )
-                              log_session.add(log_msg)
-                              log_session.commit()
-                              # Optional: Broadcast the log message to chat? 
-                              # The clients might just see it on refresh or we can broadcast it as a 'message' type separately.
-                              # For now, let's auto-broadcast it as a chat message too so it appears in feed instantly.
-                              log_session.refresh(log_msg)
-                              chat_log = {
-                                "type": "message",
-                                "id": log_msg.id,
-                                "sender_id": log_msg.sender_id,
-                                "sender_username": log_msg.sender_username,
-                                "receiver_id": log_msg.receiver_id,
-                                "content": log_msg.content,
-                                "msg_type": "call", # Custom field for frontend distinction
-                                "created_at": log_msg.created_at.isoformat()
-                              }
-                              await manager.broadcast(json.dumps(chat_log), receiver_id=receiver_id, sender_id=user_id)
-                              
+                          # Auto-broadcast the log message as a chat message so it appears in feed instantly.
+                          chat_log = await run_db(_save_call_log, user_id, sender_username, receiver_id, log_content)
+                          await manager.broadcast(json.dumps(chat_log), receiver_id=receiver_id, sender_id=user_id)
                       except Exception as e:
-                          print(f"Failed to log call start: {e}")
-
-                 elif msg_type == "hang-up":
-                      # Call Ended
-                      try:
-                          with Session(engine) as log_session:
-                              log_msg = Message(
-                                  sender_id=user_id,
-                                  sender_username=sender_username,
-                                  receiver_id=receiver_id,
-                                  content="Voice Call Ended",
-                                  type="call",
-                                  created_at=datetime.utcnow()
-                              )
-                              log_session.add(log_msg)
-                              log_session.commit()
-                              log_session.refresh(log_msg)
-                              chat_log = {
-                                "type": "message",
-                                "id": log_msg.id,
-                                "sender_id": log_msg.sender_id,
-                                "sender_username": log_msg.sender_username,
-                                "receiver_id": log_msg.receiver_id,
-                                "content": log_msg.content,
-                                "msg_type": "call",
-                                "created_at": log_msg.created_at.isoformat()
-                              }
-                              await manager.broadcast(json.dumps(chat_log), receiver_id=receiver_id, sender_id=user_id)
-                      except Exception as e:
-                          print(f"Failed to log call end: {e}")
+                          print(f"Failed to log call {'start' if msg_type == 'answer' else 'end'}: {e}")
                  
                  continue # Done handling signaling
 
             # Chat Message
-            group_members = None
+            response, group_members = await run_db(
+                _save_chat_message,
+                user_id=user_id,
+                sender_username=sender_username,
+                receiver_id=receiver_id,
+                group_id=group_id,
+                content=content,
+                msg_type=message_data.get("msg_type", "text") # Allow frontend to specify type if needed, default text
+            )
             
-            with Session(engine) as session:
-                if group_id:
-                     # Get members
-                     members = session.exec(select(GroupMember).where(GroupMember.group_id == group_id)).all()
-                     group_members = [m.user_id for m in members]
-                
-                msg = Message(
-                    sender_id=user_id,
-                    sender_username=sender_username,
-                    receiver_id=receiver_id,
-                    group_id=group_id,
-                    content=content,
-                    type=message_data.get("msg_type", "text"), # Allow frontend to specify type if needed, default text
-                    created_at=datetime.utcnow()
-                )
-                session.add(msg)
-                session.commit()
-                session.refresh(msg)
-                
-                response = {
-                    "type": "message", # Explicit type
-                    "id": msg.id,
-                    "sender_id": msg.sender_id,
-                    "sender_username": msg.sender_username,
-                    "receiver_id": msg.receiver_id,
-                    "group_id": msg.group_id,
-                    "content": msg.content,
-                    "msg_type": msg.type,
-                    "created_at": msg.created_at.isoformat()
-                }
-                
-                await manager.broadcast(
-                    json.dumps(response), 
-                    receiver_id=receiver_id, 
-                    sender_id=user_id, 
-                    group_members=group_members
-                )
+            await manager.broadcast(
+                json.dumps(response), 
+                receiver_id=receiver_id, 
+                sender_id=user_id, 
+                group_members=group_members
+            )
 
     except WebSocketDisconnect:
         manager.disconnect(websocket, user_id)
@@ -433,28 +429,17 @@ async def send_message_http(
     """
     try:
         # 1. Moderation Check (Text Only for now via HTTP)
-        mod_result = moderate_text(req.content)
+        mod_result = await run_moderation(moderate_text, req.content)
         
-        # Log Moderation
-        # Use a new session for logging or commit properly
-        # We can use the same session if we commit. But if moderate logs are separate, we might want separate session.
-        # Original code used separate session. Let's keep it safe.
-        from app.db import engine
-        from sqlmodel import Session
-        try:
-             with Session(engine) as log_session:
-                from app import crud
-                crud.create_moderation_log(
-                    log_session,
-                    content_type="text",
-                    content_excerpt=req.content,
-                    is_flagged=mod_result.get("is_flagged"),
-                    details=str(mod_result),
-                    source=str(current_user.id),
-                    original_language=mod_result.get("original_language", "en")
-                )
-        except Exception as log_err:
-             print(f"Moderation logging failed: {log_err}")
+        # Log Moderation (separate session, off the event loop)
+        submit_db(
+            _log_moderation,
+            content_type="text",
+            content_excerpt=req.content,
+            mod_result=mod_result,
+            user_id=current_user.id,
+            original_language=mod_result.get("original_language", "en")
+        )
 
         if mod_result.get("is_flagged"):
             reason = "Content Policy Violation"
@@ -1,29 +1,35 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Body, Depends
 from pydantic import BaseModel
-import base64
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from sqlmodel import Session
 from app.db import get_session
-from app.crud import create_log
-from app.services.text_moderator import moderate_text
-from app.services.image_moderator import moderate_image_base64
+from app.crud import create_log, create_logs_bulk
+from app.services.text_moderator import moderate_text, moderate_texts, get_cache_stats, get_cascade_stats
+from app.services.image_moderator import moderate_image_base64, moderate_image_bytes, moderate_images
 from app.services.audio_moderator import moderate_audio_base64
 from app.deps import get_current_user
+from app.services import batcher, media_verdicts
+from app.services.workers import run_moderation
 
 router = APIRouter(prefix="/api", tags=["moderation"])
 
+# Upper bound on texts per /moderate/text/batch request
+MAX_BATCH_TEXTS = 500
+# Upper bound on attachments per /moderate/image-files request
+MAX_BATCH_IMAGES = 32
+
 class TextModerationRequest(BaseModel):
     text: str
 
+class TextBatchModerationRequest(BaseModel):
+    texts: List[str]
+
 @router.post("/moderate/text")
 async def moderate_text_api(request: TextModerationRequest, session: Session = Depends(get_session), current_user = Depends(get_current_user)):
     try:
-        # Fetch blocked terms
-        from app.models import BlockedTerm
-        from sqlmodel import select
-        blocked_terms = session.exec(select(BlockedTerm.term)).all()
-        
-        result = moderate_text(request.text, additional_keywords=blocked_terms)
+        # Dynamic blocked terms come from the shared in-memory blocklist. Off the
+        # event loop, so concurrent requests can share a micro-batch
+        result = await run_moderation(moderate_text, request.text)
         excerpt = (request.text[:300] + "...") if len(request.text) > 300 else request.text
         is_flagged = bool(result.get("is_flagged"))
         original_language = result.get("original_language")
@@ -41,12 +47,53 @@ async def moderate_text_api(request: TextModerationRequest, session: Session = D
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/moderate/text/batch")
+def moderate_text_batch_api(request: TextBatchModerationRequest, session: Session = Depends(get_session), current_user = Depends(get_current_user)):
+    """Moderate up to MAX_BATCH_TEXTS texts in one call (backfills/imports). No trust-score penalty is applied."""
+    if len(request.texts) > MAX_BATCH_TEXTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_TEXTS} texts per batch")
+    try:
+        results = moderate_texts(request.texts)
+
+        create_logs_bulk(session, [
+            {
+                "content_type": "text",
+                "content_excerpt": (text[:300] + "...") if len(text) > 300 else text,
+                "is_flagged": bool(result.get("is_flagged")),
+                "details": result,
+                "source": str(current_user.id),
+                "original_language": result.get("original_language")
+            }
+            for text, result in zip(request.texts, results)
+        ])
+        return {
+            "status": "success",
+            "flagged_count": sum(1 for r in results if r.get("is_flagged")),
+            "data": results
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/moderate/cache-stats")
+def moderation_cache_stats(current_user = Depends(get_current_user)):
+    """Hit rates of the in-process verdict and translation caches"""
+    return {"status": "success", "data": {**get_cache_stats(), "media_verdicts": media_verdicts.stats()}}
+
+@router.get("/moderate/inference-stats")
+def moderation_inference_stats(current_user = Depends(get_current_user)):
+    """Micro-batch size and queue-wait histograms per model"""
+    return {"status": "success", "data": batcher.get_stats()}
+
+@router.get("/moderate/cascade-stats")
+def moderation_cascade_stats(current_user = Depends(get_current_user)):
+    """How many texts exit at each cascade stage and the time spent per stage"""
+    return {"status": "success", "data": get_cascade_stats()}
+
 @router.post("/moderate/image-file")
 async def moderate_image_file(file: UploadFile = File(...), session: Session = Depends(get_session), current_user = Depends(get_current_user)):
     try:
         contents = await file.read()
-        b64 = base64.b64encode(contents).decode("utf-8")
-        result = moderate_image_base64(b64)
+        result = await run_moderation(moderate_image_bytes, contents)
         excerpt = getattr(file, 'filename', 'image_upload')
         is_flagged = bool(result.get("is_flagged"))
         create_log(session, content_type="image", content_excerpt=excerpt, is_flagged=is_flagged, details=result, source=str(current_user.id))
@@ -54,13 +101,39 @@ async def moderate_image_file(file: UploadFile = File(...), session: Session = D
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/moderate/image-files")
+async def moderate_image_files(files: List[UploadFile] = File(...), stop_on_first_hit: bool = False, session: Session = Depends(get_session), current_user = Depends(get_current_user)):
+    """Moderate several attachments with one batched NSFW pass. stop_on_first_hit skips the rest after a decisive hit."""
+    if len(files) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IMAGES} images per request")
+    try:
+        contents = [await f.read() for f in files]
+        results = await run_moderation(moderate_images, contents, stop_on_first_hit=stop_on_first_hit)
+        create_logs_bulk(session, [
+            {
+                "content_type": "image",
+                "content_excerpt": getattr(f, 'filename', 'image_upload'),
+                "is_flagged": bool(result.get("is_flagged")),
+                "details": result,
+                "source": str(current_user.id)
+            }
+            for f, result in zip(files, results) if not result.get("skipped")
+        ])
+        return {
+            "status": "success",
+            "flagged_count": sum(1 for r in results if r.get("is_flagged")),
+            "data": results
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/moderate/image-base64")
 async def moderate_image_b64(payload: Dict = Body(...), session: Session = Depends(get_session), current_user = Depends(get_current_user)):
     try:
         b64 = payload.get("image_base64")
         if not b64:
             raise HTTPException(status_code=400, detail="Missing image_base64")
-        result = moderate_image_base64(b64)
+        result = await run_moderation(moderate_image_base64, b64)
         is_flagged = bool(result.get("is_flagged"))
         create_log(session, content_type="image", content_excerpt="image_base64", is_flagged=is_flagged, details=result, source=str(current_user.id))
         return {"status": "success", "data": result}
@@ -75,7 +148,7 @@ async def moderate_audio_b64(payload: Dict = Body(...), session: Session = Depen
         b64 = payload.get("audio_base64")
         if not b64:
             raise HTTPException(status_code=400, detail="Missing audio_base64")
-        result = moderate_audio_base64(b64)
+        result = await run_moderation(moderate_audio_base64, b64)
         transcript = result.get("transcript", "") if isinstance(result, dict) else ""
         excerpt = (transcript[:300] + "...") if len(transcript) > 300 else transcript
         is_flagged = bool(result.get("moderation", {}).get("is_flagged")) if isinstance(result, dict) else False
@@ -4,6 +4,7 @@ from typing import List
 from app.db import get_session
 from app.models import ModerationLog, User
 from app.deps import get_current_user
+from app.services import bad_image_index, media_verdicts
 
 router = APIRouter(prefix="/api/review", tags=["review"])
 
@@ -42,10 +43,22 @@ def resolve_log(
     elif action == "confirm":
         log.review_status = "confirmed"
         # Log remains flagged. Could apply extra penalty here.
+        # Remember confirmed images so re-encoded copies are blocked before the model runs
+        bad_image_index.add_confirmed(session, log, added_by=str(current_user.id))
     else:
         raise HTTPException(status_code=400, detail="Invalid action")
     
     session.add(log)
     session.commit()
     session.refresh(log)
+    if action == "confirm":
+        bad_image_index.refresh()
+    elif action == "dismiss" and log.content_type in ("image", "video"):
+        # Otherwise re-uploading the same bytes hits the stored flagged verdict
+        digest = media_verdicts.sha256_from_details(log.details)
+        if digest:
+            try:
+                media_verdicts.approve(digest)
+            except Exception as e:
+                print(f"MediaVerdict approval failed: {e}")
     return {"status": "success", "data": log}
@@ -56,15 +56,8 @@ def create_post(
     session: Session = Depends(get_session)
 ):
     try:
-        # Moderate the content
-        from app.models import BlockedTerm
-        from sqlmodel import select
-        try:
-            blocked_terms = session.exec(select(BlockedTerm.term)).all()
-        except Exception:
-            blocked_terms = []
-        
-        moderation_result = moderate_text(post_in.content, additional_keywords=blocked_terms)
+        # Moderate the content (dynamic blocked terms come from the shared in-memory blocklist)
+        moderation_result = moderate_text(post_in.content)
         is_flagged = moderation_result.get("is_flagged", False)
         flag_reason = None
         
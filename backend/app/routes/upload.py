@@ -1,9 +1,9 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
-import shutil
 import os
 import uuid
 from typing import Optional
 from pydantic import BaseModel
+from app.services import ingest
 
 router = APIRouter(prefix="/api/upload", tags=["upload"])
 
@@ -27,23 +27,32 @@ except OSError:
 
 @router.post("")
 async def upload_file(file: UploadFile = File(...)):
+    tmp_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}.part")
     try:
-        # Generate unique filename
-        file_ext = os.path.splitext(file.filename)[1]
-        unique_name = f"{uuid.uuid4()}{file_ext}"
+        # Stream to a temp name, checking type and size as the bytes arrive
+        saved = await ingest.save_upload(file, tmp_path, kinds=("image", "video", "audio"))
+
+        # Name the file by its content so re-uploads of the same bytes share one copy
+        file_ext = os.path.splitext(file.filename or "")[1]
+        unique_name = f"{saved['sha256']}{file_ext}"
         file_path = os.path.join(UPLOAD_DIR, unique_name)
-        
-        # Save file to disk
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        if os.path.exists(file_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, file_path)
             
         # Return URL (assuming static mount at /uploads)
         # Note: In production (Vercel), this local storage won't work perfectly for persistence,
         # but is required for the demo to function now.
         return {
             "url": f"/uploads/{unique_name}", 
-            "type": "image" if file.content_type.startswith("image") else "video"
+            "type": saved["kind"],
+            "sha256": saved["sha256"]
         }
+    except ingest.IngestError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
         print(f"Upload failed: {e}")
         raise HTTPException(status_code=500, detail="File upload failed")
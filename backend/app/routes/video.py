@@ -1,48 +1,41 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from app.services.video_moderator import moderate_video
-import shutil
+from app.services import ingest, video_jobs
 import os
-import tempfile
-from app.models import ModerationLog
-from app.crud import create_log
-from app.db import get_session
-from sqlmodel import Session
 from app.deps import get_current_user
 
 router = APIRouter(prefix="/api/moderate", tags=["moderation"])
 
-@router.post("/video")
+@router.post("/video", status_code=202)
 async def moderate_video_endpoint(
     file: UploadFile = File(...),
-    session: Session = Depends(get_session),
     current_user = Depends(get_current_user)
 ):
+    """Queue a video for moderation; poll GET /api/moderate/video/{job_id} for progress and the verdict"""
     if not file.content_type.startswith("video/"):
         raise HTTPException(400, "File must be a video")
-        
-    # Save upload to temp file
-    fd, tmp_path = tempfile.mkstemp(suffix=".mp4")
-    os.close(fd)
-    
+    if not video_jobs.accepting_jobs():
+        raise HTTPException(503, "Video moderation needs a long-lived worker; none is configured for this deployment")
+
+    # Stream the upload to where the job worker (possibly after a restart) can find it
+    suffix = os.path.splitext(file.filename or "")[1] or ".mp4"
+    file_path = video_jobs.upload_path(suffix)
+
     try:
-        with open(tmp_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-            
-        # Moderate
-        result = moderate_video(tmp_path)
-        
-        # Log result
-        create_log(
-            session,
-            content_type="video",
-            content_excerpt=f"Video: {file.filename}",
-            is_flagged=result["is_flagged"],
-            details=result,
-            source=current_user.email
-        )
-        
-        return {"data": result}
-        
-    finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+        saved = await ingest.save_upload(file, file_path, kinds=("video",))
+        job = video_jobs.enqueue(file_path, file.filename, source=current_user.email, user_id=current_user.id, sha256=saved["sha256"])
+    except ingest.IngestError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+
+    return {"job_id": job.job_id, "status": job.status}
+
+@router.get("/video/{job_id}")
+def video_job_status(job_id: str, current_user = Depends(get_current_user)):
+    """Job progress (stage, frames scanned) and, once done, the verdict in data"""
+    job = video_jobs.get_job(job_id)
+    if job is None or (job.user_id != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return video_jobs.to_dict(job)
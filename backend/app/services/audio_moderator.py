@@ -1,13 +1,26 @@
-import os, tempfile, base64
-from typing import Dict
+import os, tempfile, base64, shutil, subprocess, threading, time
+from typing import BinaryIO, Dict, Optional, Union
 
 try:
     import whisper
 except Exception:
     whisper = None
 
+try:
+    import numpy as np
+except Exception:
+    np = None
+
 from app.services.text_moderator import moderate_text
 
+WHISPER_SAMPLE_RATE = 16000  # Whisper expects 16 kHz mono
+AUDIO_PIPE_CHUNK = 1 << 20  # bytes of PCM read from ffmpeg at a time
+FFPROBE_TIMEOUT = float(os.environ.get("FFPROBE_TIMEOUT", "15"))
+AUDIO_EXTRACT_TIMEOUT = float(os.environ.get("AUDIO_EXTRACT_TIMEOUT", "300"))
+# With a cancel token, audio is transcribed and moderated in windows this long so
+# the work can stop between windows (and stop early on a flagged window)
+AUDIO_WINDOW_SECONDS = float(os.environ.get("AUDIO_WINDOW_SECONDS", "60"))
+
 _whisper = None
 
 def _load_whisper(name="base"):
@@ -18,38 +31,248 @@ def _load_whisper(name="base"):
         _whisper = whisper.load_model(name)
     return _whisper
 
-def moderate_audio_base64(b64_str: str, model_name="base") -> Dict:
-    """Moderate audio by transcribing and checking content"""
-    if not b64_str:
+def _moderate_transcription(audio, model_name="base") -> Dict:
+    """Transcribe (a path or a 16 kHz mono float32 array) and moderate the transcript"""
+    try:
+        model = _load_whisper(model_name)
+        res = model.transcribe(audio)
+        transcript = res.get("text", "").strip()
+        
+        # Moderate the transcribed text
+        moderation = moderate_text(transcript)
+        
+        return {
+            "is_flagged": moderation.get("is_flagged", False),
+            "transcript": transcript,
+            "transcript_length": len(transcript),
+            "moderation": moderation,
+            "reason": "Inappropriate language/content detected in audio transcript" if moderation.get("is_flagged") else "Audio is clean"
+        }
+    except Exception as e:
+        return {
+            "error": str(e),
+            "is_flagged": False,
+            "transcript": "",
+            "moderation": {}
+        }
+
+def moderate_audio_file(path: str, model_name="base") -> Dict:
+    """
+    Moderate audio by transcribing and checking content.
+    path can be any file ffmpeg can decode, including a video container.
+    """
+    return _moderate_transcription(path, model_name)
+
+def _cancelled_result() -> Dict:
+    return {
+        "cancelled": True,
+        "is_flagged": False,
+        "transcript": "",
+        "moderation": {}
+    }
+
+def _moderate_windows(audio, model_name, cancel) -> Dict:
+    """
+    Transcribe the array window by window, checking the cancel token between
+    windows. A window whose transcript is flagged settles the verdict; a clean
+    run is moderated once more as a whole, like the single-pass path.
+    """
+    try:
+        model = _load_whisper(model_name)
+        window = max(1, int(AUDIO_WINDOW_SECONDS * WHISPER_SAMPLE_RATE))
+        options = {}
+        parts = []
+        for start in range(0, len(audio), window):
+            if cancel.is_set():
+                return _cancelled_result()
+            res = model.transcribe(audio[start:start + window], **options)
+            # Detect the language once, and carry context across the window cut
+            options["language"] = res.get("language")
+            text = res.get("text", "").strip()
+            if not text:
+                continue
+            parts.append(text)
+            options["initial_prompt"] = text[-200:]
+            moderation = moderate_text(text)
+            if moderation.get("is_flagged"):
+                transcript = " ".join(parts)
+                return {
+                    "is_flagged": True,
+                    "transcript": transcript,
+                    "transcript_length": len(transcript),
+                    "moderation": moderation,
+                    "stopped_at_seconds": round(min(len(audio), start + window) / WHISPER_SAMPLE_RATE, 1),
+                    "reason": "Inappropriate language/content detected in audio transcript"
+                }
+
+        transcript = " ".join(parts)
+        moderation = moderate_text(transcript)
+        return {
+            "is_flagged": moderation.get("is_flagged", False),
+            "transcript": transcript,
+            "transcript_length": len(transcript),
+            "moderation": moderation,
+            "reason": "Inappropriate language/content detected in audio transcript" if moderation.get("is_flagged") else "Audio is clean"
+        }
+    except Exception as e:
+        return {
+            "error": str(e),
+            "is_flagged": False,
+            "transcript": "",
+            "moderation": {}
+        }
+
+def has_audio_stream(path: str) -> Optional[bool]:
+    """Whether the container has an audio stream (ffprobe reads headers only); None if it can't tell"""
+    if not shutil.which("ffprobe"):
+        return None
+    try:
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "a", "-show_entries", "stream=index", "-of", "csv=p=0", path],
+            capture_output=True, timeout=FFPROBE_TIMEOUT
+        )
+    except Exception as e:
+        print(f"ffprobe failed: {e}")
+        return None
+    if out.returncode != 0:
+        return None
+    return bool(out.stdout.strip())
+
+def extract_audio(path: str, cancel=None):
+    """
+    Decode the first audio track to 16 kHz mono float32, the array Whisper
+    takes. ffmpeg writes raw PCM to a pipe that is converted chunk by chunk,
+    so the audio never goes through a temp file or base64. Returns None if the cancel
+    token (a threading.Event) is set while decoding. ffmpeg is killed on
+    cancel and after AUDIO_EXTRACT_TIMEOUT seconds (RuntimeError).
+    """
+    if np is None:
+        raise RuntimeError("numpy not installed")
+    cmd = [
+        "ffmpeg", "-nostdin", "-v", "error", "-threads", "0", "-i", path,
+        "-map", "0:a:0", "-vn", "-f", "s16le", "-ac", "1", "-ar", str(WHISPER_SAMPLE_RATE), "-"
+    ]
+    # stderr goes to a file, not a pipe: an undrained pipe fills up and deadlocks ffmpeg
+    with tempfile.TemporaryFile() as err_file:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err_file)
+        done = threading.Event()
+        timed_out = threading.Event()
+
+        def watchdog():
+            # A blocked stdout read can't notice cancel or the deadline itself; killing ffmpeg ends it
+            deadline = time.monotonic() + AUDIO_EXTRACT_TIMEOUT
+            while not done.wait(0.1):
+                if cancel is not None and cancel.is_set():
+                    break
+                if time.monotonic() > deadline:
+                    timed_out.set()
+                    break
+            if proc.poll() is None:
+                proc.kill()
+
+        watcher = threading.Thread(target=watchdog, name="ffmpeg-watchdog", daemon=True)
+        watcher.start()
+        chunks = []
+        carry = b""
+        try:
+            while True:
+                data = proc.stdout.read(AUDIO_PIPE_CHUNK)
+                if not data:
+                    break
+                data = carry + data
+                usable = len(data) - len(data) % 2  # whole int16 samples only
+                carry = data[usable:]
+                chunks.append(np.frombuffer(data[:usable], dtype=np.int16).astype(np.float32) / 32768.0)
+            proc.wait()
+        finally:
+            done.set()
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+            watcher.join()
+
+        if cancel is not None and cancel.is_set():
+            return None
+        if timed_out.is_set():
+            raise RuntimeError(f"ffmpeg audio extraction timed out after {AUDIO_EXTRACT_TIMEOUT:.0f}s")
+        if proc.returncode != 0:
+            err_file.seek(0)
+            err = err_file.read(4096).decode(errors="ignore").strip()
+            raise RuntimeError(f"ffmpeg audio extraction failed: {err[:200]}")
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+
+def moderate_media_audio(path: str, model_name="base", cancel=None) -> Dict:
+    """
+    Moderate the audio track of a media file (e.g. a video upload). Skips
+    extraction when ffprobe reports no audio stream. With a cancel token
+    (threading.Event) the work stops once it is set and the result has
+    "cancelled": True; it is transcribed in AUDIO_WINDOW_SECONDS windows.
+    """
+    no_audio = {
+        "is_flagged": False,
+        "transcript": "",
+        "transcript_length": 0,
+        "moderation": {},
+        "reason": "No audio stream"
+    }
+    if has_audio_stream(path) is False:
+        return no_audio
+    try:
+        audio = extract_audio(path, cancel)
+    except Exception as e:
+        # Without ffprobe the missing track only shows up as ffmpeg's map error
+        if "matches no streams" in str(e):
+            return no_audio
+        return {
+            "error": str(e),
+            "is_flagged": False,
+            "transcript": "",
+            "moderation": {}
+        }
+    if audio is None:
+        return _cancelled_result()
+    if not len(audio):
+        return no_audio
+    if cancel is not None:
+        return _moderate_windows(audio, model_name, cancel)
+    return _moderate_transcription(audio, model_name)
+
+def moderate_audio_bytes(audio: Union[bytes, BinaryIO], model_name="base", suffix: str = ".wav") -> Dict:
+    """Moderate audio held in memory (bytes or a binary file object); Whisper reads from a path, so it is spooled to a temp file once"""
+    if not audio:
         raise ValueError("empty audio")
     
     try:
-        audio_bytes = base64.b64decode(b64_str)
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-            tmp.write(audio_bytes)
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+            if isinstance(audio, (bytes, bytearray, memoryview)):
+                tmp.write(audio)
+            else:
+                shutil.copyfileobj(audio, tmp)
             tmp_path = tmp.name
-        
+    except Exception as e:
+        return {
+            "error": str(e),
+            "is_flagged": False,
+            "transcript": "",
+            "moderation": {}
+        }
+    
+    try:
+        return moderate_audio_file(tmp_path, model_name)
+    finally:
         try:
-            model = _load_whisper(model_name)
-            res = model.transcribe(tmp_path)
-            transcript = res.get("text", "").strip()
-            
-            # Moderate the transcribed text
-            moderation = moderate_text(transcript)
-            
-            return {
-                "is_flagged": moderation.get("is_flagged", False),
-                "transcript": transcript,
-                "transcript_length": len(transcript),
-                "moderation": moderation,
-                "reason": "Inappropriate language/content detected in audio transcript" if moderation.get("is_flagged") else "Audio is clean"
-            }
-        finally:
-            try:
-                os.remove(tmp_path)
-            except:
-                pass
+            os.remove(tmp_path)
+        except:
+            pass
+
+def moderate_audio_base64(b64_str: str, model_name="base") -> Dict:
+    """Base64 wrapper around moderate_audio_bytes"""
+    if not b64_str:
+        raise ValueError("empty audio")
     
+    try:
+        audio_bytes = base64.b64decode(b64_str)
     except Exception as e:
         return {
             "error": str(e),
@@ -57,3 +280,4 @@ def moderate_audio_base64(b64_str: str, model_name="base") -> Dict:
             "transcript": "",
             "moderation": {}
         }
+    return moderate_audio_bytes(audio_bytes, model_name)
@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.services.perceptual_hash import MultiIndexHash, from_hex, hamming
+from app.services.utils import parse_log_details
+
+# Max Hamming distance (of 64 bits) for a near-duplicate. dHash is the
+# indexed key; pHash, when both sides have one, must agree as well.
+DHASH_MAX_DISTANCE = int(os.environ.get("IMAGE_DHASH_MAX_DISTANCE", "10"))
+PHASH_MAX_DISTANCE = int(os.environ.get("IMAGE_PHASH_MAX_DISTANCE", "10"))
+# How often a worker picks up hashes confirmed through another worker/process
+REFRESH_SECONDS = float(os.environ.get("BAD_IMAGE_REFRESH_SECONDS", "30"))
+
+_lock = threading.Lock()
+_index = MultiIndexHash()
+_max_id = 0  # highest BlockedImageHash.id loaded so far
+_checked_at = None
+_refresher = None  # background thread running a stale-triggered refresh
+_refresher_lock = threading.Lock()
+
+
+def _fetch_rows(after_id: int):
+    from sqlmodel import Session, select
+    from app.db import engine
+    from app.models import BlockedImageHash
+
+    with Session(engine) as session:
+        statement = select(BlockedImageHash).where(BlockedImageHash.id > after_id).order_by(BlockedImageHash.id)
+        return session.exec(statement).all()
+
+
+def refresh() -> int:
+    """Load BlockedImageHash rows added since the last refresh (all of them at startup); returns the index size"""
+    global _max_id, _checked_at
+    with _lock:
+        try:
+            rows = _fetch_rows(_max_id)
+        except Exception as e:
+            print(f"Bad image index refresh failed: {e}")
+            rows = []
+        for row in rows:
+            _index.add(from_hex(row.dhash), (row.id, from_hex(row.phash)))
+            _max_id = max(_max_id, row.id)
+        _checked_at = time.monotonic()
+        return _index.size
+
+
+def _ensure_fresh():
+    global _refresher
+    if _checked_at is not None and time.monotonic() - _checked_at < REFRESH_SECONDS:
+        return
+    if _checked_at is None:
+        refresh()  # First load blocks so lookups never miss the confirmed set
+        return
+    # Stale: pick up new rows in the background and keep serving the current index
+    with _refresher_lock:
+        if _refresher is not None and _refresher.is_alive():
+            return
+        _refresher = threading.Thread(target=refresh, name="bad-image-refresh", daemon=True)
+        _refresher.start()
+
+
+def lookup(dhash_value: int, phash_value: Optional[int] = None) -> Optional[Dict]:
+    """Nearest confirmed-bad image within the distance limits, or None"""
+    _ensure_fresh()
+    if not _index.size:
+        return None
+    for distance, (row_id, row_phash) in _index.search(dhash_value, DHASH_MAX_DISTANCE):
+        if phash_value is not None and row_phash is not None:
+            if hamming(phash_value, row_phash) > PHASH_MAX_DISTANCE:
+                continue
+        return {"id": row_id, "distance": distance}
+    return None
+
+
+def hashes_from_details(details: Optional[str]) -> List[Tuple[str, Optional[str]]]:
+    """(dhash, phash) hex pairs recorded in a ModerationLog's details: the image itself or flagged video frames"""
+    data = parse_log_details(details)
+    if not isinstance(data, dict):
+        return []
+    found = []
+    image = data.get("details")
+    if isinstance(image, dict) and image.get("dhash"):
+        found.append((image["dhash"], image.get("phash")))
+    for flag in data.get("flags") or []:
+        if isinstance(flag, dict) and flag.get("dhash"):
+            found.append((flag["dhash"], flag.get("phash")))
+    return found
+
+
+def add_confirmed(session, log, added_by: Optional[str] = None) -> int:
+    """
+    Stage BlockedImageHash rows for a confirmed ModerationLog on the caller's
+    session. Call refresh() after the commit to make them live in this worker.
+    """
+    from app.models import BlockedImageHash
+
+    added = 0
+    for dhash_hex, phash_hex in hashes_from_details(log.details):
+        # Exact duplicates of a known hash add nothing to the index
+        if any(d == 0 for d, _ in _index.search(from_hex(dhash_hex), 0)):
+            continue
+        session.add(BlockedImageHash(dhash=dhash_hex, phash=phash_hex, log_id=log.id, added_by=added_by))
+        added += 1
+    return added
+
+
+def size() -> int:
+    return _index.size
@@ -0,0 +1,104 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+from app.services.utils import Histogram
+
+# Collect concurrent model calls for at most this long, or until MAX_SIZE items
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("MICROBATCH_MAX_WAIT_MS", "5"))
+MICROBATCH_MAX_SIZE = int(os.environ.get("MICROBATCH_MAX_SIZE", "16"))
+# Set to 0 to call the models directly (batch size 1)
+MICROBATCH_ENABLED = os.environ.get("MICROBATCH_ENABLED", "1") not in ("0", "false", "False")
+
+
+class MicroBatcher:
+    """
+    Groups single-item model calls from many threads into one batched call.
+    infer_batch takes a list of inputs and returns a list of outputs in the
+    same order; each caller blocks only on its own item's future.
+    """
+
+    def __init__(self, name: str, infer_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = MICROBATCH_MAX_SIZE, max_wait_ms: float = MICROBATCH_MAX_WAIT_MS):
+        self.name = name
+        self.infer_batch = infer_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self.batch_sizes = Histogram((1, 2, 4, 8, 16, 32, 64))
+        self.queue_wait_ms = Histogram((1, 2, 5, 10, 20, 50, 100, 250, 1000))
+        self.infer_ms = Histogram((5, 10, 25, 50, 100, 250, 500, 1000, 2500))
+        self._worker = threading.Thread(target=self._run, name=f"microbatch-{name}", daemon=True)
+        self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        future: Future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def __call__(self, item: Any, timeout: float = None) -> Any:
+        return self.submit(item).result(timeout)
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.queue_wait_ms.observe((started - enqueued) * 1000)
+            self.batch_sizes.observe(len(batch))
+            try:
+                outputs = self.infer_batch([item for item, _, _ in batch])
+                if len(outputs) != len(batch):
+                    raise RuntimeError(f"{self.name}: model returned {len(outputs)} outputs for {len(batch)} inputs")
+                for (_, future, _), output in zip(batch, outputs):
+                    future.set_result(output)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            self.infer_ms.observe((time.perf_counter() - started) * 1000)
+
+    def stats(self) -> Dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queued": self._queue.qsize(),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "infer_ms": self.infer_ms.snapshot(),
+        }
+
+
+_registry_lock = threading.Lock()
+_registry: Dict[str, MicroBatcher] = {}
+
+
+def get_batcher(name: str, infer_batch: Callable[[List[Any]], List[Any]]) -> MicroBatcher:
+    """Shared batcher for a model, created on first use"""
+    batcher = _registry.get(name)
+    if batcher is None:
+        with _registry_lock:
+            batcher = _registry.get(name)
+            if batcher is None:
+                batcher = MicroBatcher(name, infer_batch)
+                _registry[name] = batcher
+    return batcher
+
+
+def get_stats() -> Dict:
+    return {"enabled": MICROBATCH_ENABLED, "batchers": {name: b.stats() for name, b in _registry.items()}}
@@ -0,0 +1,88 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Tuple
+
+# How often a worker re-reads BlockedTerm rows so edits made through another
+# worker/process become visible without a restart.
+REFRESH_SECONDS = float(os.environ.get("BLOCKLIST_REFRESH_SECONDS", "30"))
+
+_lock = threading.Lock()
+# (generation, terms, matcher) swapped as one tuple so readers never see a mix
+_state = (0, (), None)
+_checked_at = None  # time.monotonic() of the last DB validation
+_refresher = None  # background thread running a stale-triggered refresh
+_refresher_lock = threading.Lock()
+
+
+def _fetch_terms() -> Tuple[str, ...]:
+    from sqlmodel import Session, select
+    from app.db import engine
+    from app.models import BlockedTerm
+
+    with Session(engine) as session:
+        rows = session.exec(select(BlockedTerm.term)).all()
+    return tuple(sorted({t.lower() for t in rows if t}))
+
+
+def refresh() -> int:
+    """Re-read the blocklist from the DB; bumps the generation if it changed"""
+    global _state, _checked_at
+    from app.services.text_moderator import build_matcher
+
+    with _lock:
+        generation, terms, matcher = _state
+        try:
+            new_terms = _fetch_terms()
+        except Exception as e:
+            print(f"Blocklist refresh failed: {e}")
+            new_terms = terms
+        if matcher is None or new_terms != terms:
+            _state = (generation + 1, new_terms, build_matcher(new_terms))
+        _checked_at = time.monotonic()
+        return _state[0]
+
+
+def invalidate() -> int:
+    """Call after a BlockedTerm insert/delete so this worker picks it up immediately"""
+    return refresh()
+
+
+def _ensure_fresh():
+    global _refresher
+    if _checked_at is not None and time.monotonic() - _checked_at < REFRESH_SECONDS:
+        return
+    if _state[2] is None:
+        refresh()  # Nothing to serve yet: the first load has to block
+        return
+    # Stale: re-read the DB in the background and keep serving the current state,
+    # so no request waits on the query or the matcher rebuild
+    with _refresher_lock:
+        if _refresher is not None and _refresher.is_alive():
+            return
+        _refresher = threading.Thread(target=refresh, name="blocklist-refresh", daemon=True)
+        _refresher.start()
+
+
+def snapshot():
+    """Return a consistent (generation, terms, matcher) triple"""
+    _ensure_fresh()
+    return _state
+
+
+def get_generation() -> int:
+    return snapshot()[0]
+
+
+def get_terms() -> Tuple[str, ...]:
+    return snapshot()[1]
+
+
+def fingerprint() -> str:
+    """Short digest of the current terms; unlike the generation it is stable across processes and restarts"""
+    return hashlib.sha1("\n".join(get_terms()).encode("utf-8")).hexdigest()[:12]
+
+
+def get_matcher():
+    return snapshot()[2]
@@ -0,0 +1,78 @@
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+ALLOW = "allow"
+BLOCK = "block"
+UNCERTAIN = "uncertain"
+
+
+class Cascade:
+    """
+    Runs stages cheapest first. Each stage takes the shared context dict,
+    may store ctx["result"], and returns ALLOW, BLOCK or UNCERTAIN; only
+    UNCERTAIN falls through to the next stage. Exits and time are counted
+    per stage.
+    """
+
+    def __init__(self, name: str, stages: List[Tuple[str, Callable[[Dict], str]]]):
+        self.name = name
+        self.stages = stages
+        self._lock = threading.Lock()
+        self.items = 0
+        self._stats = {stage: {"runs": 0, ALLOW: 0, BLOCK: 0, UNCERTAIN: 0, "total_ms": 0.0} for stage, _ in stages}
+
+    def run(self, ctx: Dict, stop_before: str = None, start_at: str = None) -> str:
+        """
+        Run stages until one decides. With stop_before, returns UNCERTAIN
+        when that stage is reached so the caller can run it itself (e.g.
+        batched) and report it through record(). start_at resumes an item
+        that an earlier run stopped before that stage.
+        """
+        if start_at is None:
+            with self._lock:
+                self.items += 1
+            ctx["exit_stage"] = None
+        started_stage = start_at is None
+        for stage, fn in self.stages:
+            if not started_stage:
+                if stage != start_at:
+                    continue
+                started_stage = True
+            if stage == stop_before:
+                return UNCERTAIN
+            started = time.perf_counter()
+            decision = fn(ctx)
+            self.record(stage, decision, (time.perf_counter() - started) * 1000)
+            if decision != UNCERTAIN:
+                ctx["exit_stage"] = stage
+                return decision
+        return UNCERTAIN
+
+    def has_stage(self, stage: str) -> bool:
+        return stage in self._stats
+
+    def record(self, stage: str, decision: str, elapsed_ms: float):
+        with self._lock:
+            s = self._stats[stage]
+            s["runs"] += 1
+            s[decision] += 1
+            s["total_ms"] += elapsed_ms
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stages = []
+            for stage, _ in self.stages:
+                s = self._stats[stage]
+                exits = s[ALLOW] + s[BLOCK]
+                stages.append({
+                    "stage": stage,
+                    "runs": s["runs"],
+                    "allow": s[ALLOW],
+                    "block": s[BLOCK],
+                    "uncertain": s[UNCERTAIN],
+                    "exit_share": round(exits / self.items, 4) if self.items else 0.0,
+                    "total_ms": round(s["total_ms"], 3),
+                    "mean_ms": round(s["total_ms"] / s["runs"], 3) if s["runs"] else 0.0,
+                })
+            return {"cascade": self.name, "items": self.items, "stages": stages}
@@ -1,15 +1,47 @@
 import base64
 import io
+import os
+import time
 from PIL import Image
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+from app.services.batcher import MICROBATCH_ENABLED, get_batcher
+from app.services import bad_image_index, media_verdicts
+from app.services.perceptual_hash import dhash, phash, to_hex, from_hex
 
 try:
     from transformers import pipeline
 except Exception:
     pipeline = None
 
+try:
+    import numpy as np
+except Exception:
+    np = None
+
 _nsfw_model = None
 
+# Skin analysis runs on a copy whose longest side is at most this many pixels
+SKIN_ANALYSIS_SIZE = int(os.environ.get("IMAGE_SKIN_ANALYSIS_SIZE", "128"))
+SKIN_GRID = 8  # cells per side for region statistics
+SKIN_DOMINANT_RATIO = 0.6  # share of visible pixels in the skin range
+SKIN_REGION_MIN = 0.25  # share of the frame covered by the largest contiguous skin area
+
+NSFW_MODEL_NAME = "Falconsai/nsfw_image_detection"
+NSFW_LABELS = ('nsfw', 'porn', 'hentai', 'sexy')
+NSFW_THRESHOLD = 0.5
+# Uploads are decoded with their longest side at most IMAGE_DECODE_SIZE (the classifier
+# works at 224 px); anything over IMAGE_MAX_PIXELS is rejected from the header alone
+IMAGE_DECODE_SIZE = int(os.environ.get("IMAGE_DECODE_SIZE", "448"))
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", "50000000"))
+# moderate_images: images per forward pass, decode/heuristics threads, score that ends a scan early
+IMAGE_BATCH_SIZE = int(os.environ.get("IMAGE_MODEL_BATCH_SIZE", "16"))
+IMAGE_PREPROCESS_WORKERS = int(os.environ.get("IMAGE_PREPROCESS_WORKERS", "4"))
+IMAGE_EARLY_EXIT_SCORE = float(os.environ.get("IMAGE_EARLY_EXIT_SCORE", "0.9"))
+_prep_pool = None
+# Part of the MediaVerdict key; anything that changes image verdicts belongs here
+IMAGE_MODEL_VERSION = f"{NSFW_MODEL_NAME}@{NSFW_THRESHOLD}|skin{SKIN_DOMINANT_RATIO}/{SKIN_REGION_MIN}@{SKIN_ANALYSIS_SIZE}|decode{IMAGE_DECODE_SIZE}"
+
 def _load_nsfw_model():
     """Load NSFW detection model from HuggingFace"""
     global _nsfw_model
@@ -17,18 +49,91 @@ def _load_nsfw_model():
         if pipeline is None:
             return None
         try:
-            _nsfw_model = pipeline("image-classification", model="Falconsai/nsfw_image_detection")
+            _nsfw_model = pipeline("image-classification", model=NSFW_MODEL_NAME)
         except:
             _nsfw_model = False  # Mark as failed
     return _nsfw_model
 
-def _check_image_properties(img: Image.Image) -> Dict:
-    """Check basic image properties for inappropriate content"""
+def _classify(model, img: Image.Image) -> list:
+    """Predictions for one image; concurrent callers share one forward pass via the micro-batcher"""
+    if not MICROBATCH_ENABLED:
+        return model(img)
+    batcher = get_batcher("image", lambda items: model(items, batch_size=len(items)))
+    return batcher(img)
+
+def _analysis_copy(img: Image.Image) -> Image.Image:
+    """Small copy for pixel statistics; reducing_gap lets PIL shrink by integer steps first, so this stays cheap"""
+    w, h = img.size
+    scale = SKIN_ANALYSIS_SIZE / max(w, h)
+    if scale >= 1:
+        return img.copy()
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return img.resize(size, Image.BILINEAR, reducing_gap=2.0)
+
+def _largest_region(cells) -> int:
+    """Size of the largest 4-connected group of True cells in a small 2-D boolean grid"""
+    rows, cols = cells.shape
+    seen = set()
+    best = 0
+    for r in range(rows):
+        for c in range(cols):
+            if not cells[r, c] or (r, c) in seen:
+                continue
+            seen.add((r, c))
+            stack, size = [(r, c)], 0
+            while stack:
+                y, x = stack.pop()
+                size += 1
+                for ny, nx in ((y - 1, x), (y + 1, x), (y, x - 1), (y, x + 1)):
+                    if 0 <= ny < rows and 0 <= nx < cols and cells[ny, nx] and (ny, nx) not in seen:
+                        seen.add((ny, nx))
+                        stack.append((ny, nx))
+            best = max(best, size)
+    return best
+
+def _skin_stats(img: Image.Image) -> Dict:
+    """
+    Skin-tone statistics over the whole frame, computed on a downscaled copy
+    in YCbCr space (skin clusters tightly in Cb/Cr regardless of brightness).
+    Fully transparent pixels are ignored.
+    """
+    small = _analysis_copy(img)
+    alpha = None
+    if small.mode in ('RGBA', 'LA', 'PA') or (small.mode == 'P' and 'transparency' in small.info):
+        small = small.convert('RGBA')
+        alpha = np.asarray(small.getchannel('A')) > 0
+    ycbcr = np.asarray(small.convert('RGB').convert('YCbCr'), dtype=np.int16)
+    y, cb, cr = ycbcr[..., 0], ycbcr[..., 1], ycbcr[..., 2]
+    skin = (y > 40) & (cb >= 77) & (cb <= 127) & (cr >= 133) & (cr <= 173)
+    if alpha is not None:
+        skin &= alpha
+        visible = int(alpha.sum())
+    else:
+        visible = skin.size
+    if visible == 0:
+        return {"skin_ratio": 0.0, "center_ratio": 0.0, "largest_region": 0.0}
+
+    h, w = skin.shape
+    center = skin[h // 4:h - h // 4, w // 4:w - w // 4]
+
+    # Coarse grid of skin-dominated cells: one contiguous area reads very differently from scattered specks
+    grid = min(SKIN_GRID, h, w)
+    ch, cw = h // grid, w // grid
+    cells = skin[:ch * grid, :cw * grid].reshape(grid, ch, grid, cw).mean(axis=(1, 3)) > 0.5
+
+    return {
+        "skin_ratio": float(skin.sum()) / visible,
+        "center_ratio": float(center.mean()) if center.size else 0.0,
+        "largest_region": _largest_region(cells) / float(grid * grid),
+    }
+
+def _check_image_properties(img: Image.Image, size: Optional[Tuple[int, int]] = None) -> Dict:
+    """Check basic image properties for inappropriate content; size is the original size if img was decoded smaller"""
     flags = []
+    skin = None
     try:
         # Check image size
-        w, h = img.size
-        aspect_ratio = w / h if h > 0 else 0
+        w, h = size or img.size
         
         # Check if image is extremely small (potential thumbnail of inappropriate content)
         if w < 50 or h < 50:
@@ -39,71 +144,286 @@ def _check_image_properties(img: Image.Image) -> Dict:
         if mode not in ['RGB', 'RGBA', 'L', 'P']:
             flags.append({"type": "image_format", "reason": f"Unusual format: {mode}"})
         
-        # Analyze color distribution (very high contrast can indicate explicit content)
-        if mode == 'RGB':
-            pixels = img.getdata()
-            pixel_list = list(pixels)
-            if len(pixel_list) > 100:
-                # Simple heuristic: check for skin tone dominance
-                skin_tones = sum(1 for r, g, b in pixel_list[:1000] 
-                                if 95 < r < 220 and 75 < g < 195 and 65 < b < 180)
-                skin_percentage = (skin_tones / min(1000, len(pixel_list))) * 100
-                if skin_percentage > 60:
-                    flags.append({"type": "skin_tone_dominant", "confidence": f"{skin_percentage:.1f}%"})
+        # Skin tone dominance over the whole frame (grayscale carries no colour signal)
+        if mode in ('RGB', 'RGBA', 'P') and np is not None:
+            skin = _skin_stats(img)
+            if skin["skin_ratio"] > SKIN_DOMINANT_RATIO and skin["largest_region"] >= SKIN_REGION_MIN:
+                flags.append({
+                    "type": "skin_tone_dominant",
+                    "confidence": f"{skin['skin_ratio'] * 100:.1f}%",
+                    "largest_region": round(skin["largest_region"], 3),
+                })
         
     except Exception as e:
         pass
     
-    return {"has_flags": len(flags) > 0, "flags": flags}
+    return {"has_flags": len(flags) > 0, "flags": flags, "skin": skin}
 
-def moderate_image_base64(b64_str: str) -> Dict:
-    """Moderate image for NSFW and inappropriate content"""
-    if not b64_str:
-        return {"is_flagged": False, "details": {}}
+def _decode(img_bytes: bytes) -> Tuple[Optional[Image.Image], Dict]:
+    """
+    Decode no larger than the pipeline needs. Only the header is read before
+    the pixel budget check; JPEGs then decode straight to 1/2..1/8 scale via
+    draft mode and other formats are shrunk with PIL's reducing resize.
+    Returns (None, info) when the image is over IMAGE_MAX_PIXELS.
+    """
+    started = time.perf_counter()
+    img = Image.open(io.BytesIO(img_bytes))
+    w, h = img.size
+    info = {"width": w, "height": h, "format": img.format, "mode": img.mode}
+    if w * h > IMAGE_MAX_PIXELS:
+        return None, info
+    if max(w, h) > IMAGE_DECODE_SIZE:
+        img.draft(img.mode, (IMAGE_DECODE_SIZE, IMAGE_DECODE_SIZE))
+        img.thumbnail((IMAGE_DECODE_SIZE, IMAGE_DECODE_SIZE), Image.BILINEAR, reducing_gap=2.0)
+    else:
+        img.load()
+    info["decoded_width"], info["decoded_height"] = img.size
+    info["decode_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return img, info
+
+def _too_large_result(info: Dict) -> Dict:
+    # Never decoded: a decompression bomb or simply beyond what we moderate
+    return {
+        "is_flagged": True,
+        "details": info,
+        "flags": [{"type": "image_size", "reason": f"Image exceeds pixel budget ({info['width']}x{info['height']})"}]
+    }
+
+def _known_bad_flag(dh: int, ph) -> Optional[Dict]:
+    match = bad_image_index.lookup(dh, ph)
+    if not match:
+        return None
+    return {"type": "known_bad_image", "match_id": match["id"], "distance": match["distance"]}
+
+def _recheck_stored(result: Dict) -> Dict:
+    """A stored clean verdict predates any confirmations since; re-run the (cheap) near-duplicate check"""
+    details = result.get("details", {})
+    if result.get("is_flagged") or not details.get("dhash"):
+        return result
+    try:
+        flag = _known_bad_flag(from_hex(details["dhash"]), from_hex(details.get("phash")))
+    except Exception as e:
+        print(f"Perceptual hash check failed: {e}")
+        flag = None
+    if flag:
+        result["is_flagged"] = True
+        result["flags"].append(flag)
+    return result
+
+def _prepare(img: Image.Image, info: Optional[Dict] = None) -> Tuple[Dict, bool]:
+    """
+    Hashes, known-bad lookup and property heuristics; (result, done) where done means the model isn't needed.
+    info is _decode's description of the original upload when img was decoded at reduced size.
+    """
+    w, h = img.size
+    
+    result = {
+        "is_flagged": False,
+        "details": info or {
+            "width": w,
+            "height": h,
+            "format": img.format,
+            "mode": img.mode
+        },
+        "flags": []
+    }
     
+    # Perceptual hashes go into the log, so a reviewer's confirm can add them to the index
     try:
-        img_bytes = base64.b64decode(b64_str)
-        img = Image.open(io.BytesIO(img_bytes))
-        w, h = img.size
-        
-        result = {
-            "is_flagged": False,
-            "details": {
-                "width": w,
-                "height": h,
-                "format": img.format,
-                "mode": img.mode
-            },
-            "flags": []
-        }
+        dh, ph = dhash(img), phash(img)
+        result["details"]["dhash"] = to_hex(dh)
+        result["details"]["phash"] = to_hex(ph)
+        flag = _known_bad_flag(dh, ph)
+    except Exception as e:
+        print(f"Perceptual hash check failed: {e}")
+        flag = None
+    if flag:
+        # Near-duplicate of a confirmed image: no need for the model
+        result["is_flagged"] = True
+        result["flags"].append(flag)
+        return result, True
+    
+    # Check basic image properties
+    prop_check = _check_image_properties(img, (result["details"]["width"], result["details"]["height"]))
+    if prop_check["has_flags"]:
+        result["flags"].extend(prop_check["flags"])
+        result["is_flagged"] = True
+    return result, False
+
+def _apply_predictions(result: Dict, predictions: list):
+    for pred in predictions:
+        label = pred.get('label', '').lower()
+        score = float(pred.get('score', 0))
         
-        # Check basic image properties
-        prop_check = _check_image_properties(img)
-        if prop_check["has_flags"]:
-            result["flags"].extend(prop_check["flags"])
+        # Flag if NSFW/pornography detected with high confidence
+        if label in NSFW_LABELS and score > NSFW_THRESHOLD:
             result["is_flagged"] = True
-        
-        # Try NSFW model if available
-        model = _load_nsfw_model()
-        if model and model != False:
+            result["flags"].append({
+                "type": "nsfw_model",
+                "label": label,
+                "confidence": round(score, 3)
+            })
+
+def _moderate_pil(img: Image.Image, info: Optional[Dict] = None) -> Tuple[Dict, bool]:
+    """(result, complete): complete is False when the NSFW model couldn't run, so the verdict isn't stored"""
+    result, done = _prepare(img, info)
+    if done:
+        return result, True
+    
+    # Try NSFW model if available
+    complete = False
+    model = _load_nsfw_model()
+    if model and model != False:
+        try:
+            _apply_predictions(result, _classify(model, img))
+            complete = True
+        except Exception as e:
+            pass  # Model inference failed, continue with other checks
+    
+    return result, complete
+
+def _is_decisive(result: Dict) -> bool:
+    """A hit strong enough to stop scanning the rest of a batch"""
+    for flag in result.get("flags", []):
+        if flag.get("type") == "known_bad_image":
+            return True
+        if flag.get("type") == "nsfw_model" and flag.get("confidence", 0) >= IMAGE_EARLY_EXIT_SCORE:
+            return True
+    return False
+
+def _get_prep_pool() -> ThreadPoolExecutor:
+    global _prep_pool
+    if _prep_pool is None:
+        _prep_pool = ThreadPoolExecutor(max_workers=IMAGE_PREPROCESS_WORKERS, thread_name_prefix="image-prep")
+    return _prep_pool
+
+def _prepare_item(item: Union[Image.Image, bytes]):
+    """(image, result, done, complete) for one moderate_images input; decode errors end up in result"""
+    try:
+        if isinstance(item, Image.Image):
+            img, info = item, None
+        else:
+            img, info = _decode(item)
+            if img is None:
+                return None, _too_large_result(info), True, True
+        result, done = _prepare(img, info)
+        return img, result, done, done
+    except Exception as e:
+        return None, {"error": str(e), "is_flagged": False, "details": {}}, True, False
+
+def moderate_images(
+    images: List[Union[Image.Image, bytes]],
+    batch_size: int = IMAGE_BATCH_SIZE,
+    stop_on_first_hit: bool = False,
+    use_verdict_store: bool = True
+) -> List[Dict]:
+    """
+    Moderate several images (encoded bytes or decoded frames) with batched
+    NSFW inference. Decoding, hashing and heuristics run on a thread pool,
+    then the model sees batch_size images per forward pass. With
+    stop_on_first_hit, scanning ends after the batch containing a decisive
+    hit and the remaining items come back with "skipped": True.
+    Returns one result per input, in order, shaped like moderate_image_bytes'.
+    """
+    results: List[Optional[Dict]] = [None] * len(images)
+    digests: List[Optional[str]] = [None] * len(images)
+    todo = []
+    for i, item in enumerate(images):
+        if not isinstance(item, Image.Image):
+            if not item:
+                results[i] = {"is_flagged": False, "details": {}}
+                continue
+            if use_verdict_store:
+                digests[i] = media_verdicts.sha256_bytes(item)
+                stored = media_verdicts.get(digests[i], IMAGE_MODEL_VERSION)
+                if stored is not None:
+                    stored["sha256"] = digests[i]
+                    results[i] = _recheck_stored(stored)
+                    continue
+        todo.append(i)
+
+    hit = stop_on_first_hit and any(r is not None and _is_decisive(r) for r in results)
+    model = _load_nsfw_model() if todo and not hit else None
+    pool = _get_prep_pool()
+    position = 0
+    while position < len(todo) and not hit:
+        chunk = todo[position:position + batch_size]
+        position += len(chunk)
+        prepared = list(pool.map(lambda i: _prepare_item(images[i]), chunk))
+
+        pending = []  # (input index, image) still needing the model
+        complete = {}
+        for i, (img, result, done, item_complete) in zip(chunk, prepared):
+            results[i] = result
+            complete[i] = item_complete
+            if not done:
+                pending.append((i, img))
+
+        if pending and model and model != False:
             try:
-                predictions = model(img)
-                for pred in predictions:
-                    label = pred.get('label', '').lower()
-                    score = float(pred.get('score', 0))
-                    
-                    # Flag if NSFW/pornography detected with high confidence
-                    if label in ['nsfw', 'porn', 'hentai', 'sexy'] and score > 0.5:
-                        result["is_flagged"] = True
-                        result["flags"].append({
-                            "type": "nsfw_model",
-                            "label": label,
-                            "confidence": round(score, 3)
-                        })
+                outputs = model([img for _, img in pending], batch_size=len(pending))
+                for (i, _), predictions in zip(pending, outputs):
+                    _apply_predictions(results[i], predictions)
+                    complete[i] = True
             except Exception as e:
-                pass  # Model inference failed, continue with other checks
+                print(f"Batched NSFW inference failed: {e}")
+
+        for i in chunk:
+            if digests[i]:
+                # Lets a reviewer's dismissal find the stored verdict again
+                results[i]["sha256"] = digests[i]
+                if complete[i]:
+                    media_verdicts.put(digests[i], "image", IMAGE_MODEL_VERSION, results[i])
+        hit = stop_on_first_hit and any(_is_decisive(results[i]) for i in chunk)
+
+    for i in todo[position:]:
+        results[i] = {"is_flagged": False, "skipped": True, "details": {}, "flags": []}
+    return results
+
+def moderate_image_pil(img: Image.Image) -> Dict:
+    """Moderate an already decoded image (e.g. a video frame); nothing to hash, so no verdict store"""
+    try:
+        return _moderate_pil(img)[0]
+    except Exception as e:
+        return {"error": str(e), "is_flagged": False, "details": {}}
+
+def moderate_image_bytes(img_bytes: bytes, use_verdict_store: bool = True) -> Dict:
+    """
+    Moderate image for NSFW and inappropriate content.
+    Identical bytes reuse the stored verdict (MediaVerdict) instead of running
+    the model again; pass use_verdict_store=False for one-off images.
+    """
+    if not img_bytes:
+        return {"is_flagged": False, "details": {}}
+    
+    try:
+        digest = media_verdicts.sha256_bytes(img_bytes) if use_verdict_store else None
+        if digest:
+            stored = media_verdicts.get(digest, IMAGE_MODEL_VERSION)
+            if stored is not None:
+                stored["sha256"] = digest
+                return _recheck_stored(stored)
         
+        img, info = _decode(img_bytes)
+        if img is None:
+            return _too_large_result(info)
+        result, complete = _moderate_pil(img, info)
+        if digest:
+            # Lets a reviewer's dismissal find the stored verdict again
+            result["sha256"] = digest
+            if complete:
+                media_verdicts.put(digest, "image", IMAGE_MODEL_VERSION, result)
         return result
         
     except Exception as e:
         return {"error": str(e), "is_flagged": False, "details": {}}
+
+def moderate_image_base64(b64_str: str, use_verdict_store: bool = True) -> Dict:
+    """Base64 wrapper around moderate_image_bytes"""
+    if not b64_str:
+        return {"is_flagged": False, "details": {}}
+    try:
+        img_bytes = base64.b64decode(b64_str)
+    except Exception as e:
+        return {"error": str(e), "is_flagged": False, "details": {}}
+    return moderate_image_bytes(img_bytes, use_verdict_store=use_verdict_store)
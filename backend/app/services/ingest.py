@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import os
+from typing import Dict, Iterable, Optional
+
+try:
+    import cv2
+except Exception:
+    cv2 = None
+
+# Uploads are read and written in chunks of this size, never whole
+INGEST_CHUNK_SIZE = int(os.environ.get("INGEST_CHUNK_SIZE", str(1 << 20)))
+MAX_UPLOAD_BYTES = {
+    "image": int(os.environ.get("MAX_IMAGE_UPLOAD_BYTES", str(15 * 1024 * 1024))),
+    "video": int(os.environ.get("MAX_VIDEO_UPLOAD_BYTES", str(200 * 1024 * 1024))),
+    "audio": int(os.environ.get("MAX_AUDIO_UPLOAD_BYTES", str(50 * 1024 * 1024))),
+}
+MAX_VIDEO_DURATION_SECONDS = float(os.environ.get("MAX_VIDEO_DURATION_SECONDS", "900"))
+# A video's duration is probed from the partial file once this much has arrived, then
+# at 4x steps until the container reports one (MP4 with its moov box at the end won't
+# until the upload completes), so an over-long video is cut off early
+INGEST_DURATION_PROBE_BYTES = int(os.environ.get("INGEST_DURATION_PROBE_BYTES", str(1 << 20)))
+
+# Brands/box types that may follow the size field of an ISO-BMFF (MP4/MOV/3GP) file
+_ISO_BOXES = (b"ftyp", b"moov", b"mdat", b"free", b"wide", b"skip")
+# ftyp major brands of audio-only MP4 (iTunes AAC/ALAC, audiobooks, protected, Flash audio)
+_ISO_AUDIO_BRANDS = (b"M4A ", b"M4B ", b"M4P ", b"F4A ", b"F4B ")
+
+
+class IngestError(Exception):
+    """Upload rejected; status_code is the HTTP status the route should answer with"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def sniff(head: bytes) -> Optional[str]:
+    """'image', 'video' or 'audio' from the file's leading magic number, or None"""
+    if head.startswith((b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n", b"GIF87a", b"GIF89a")):
+        return "image"
+    if head[:4] == b"RIFF":
+        if head[8:12] == b"WEBP":
+            return "image"
+        if head[8:12] == b"AVI ":
+            return "video"
+        if head[8:12] == b"WAVE":
+            return "audio"
+        return None
+    if head[4:8] in _ISO_BOXES:
+        # HEIC/AVIF stills and M4A audio share the MP4 container
+        if head[8:12] in (b"heic", b"heix", b"mif1", b"avif"):
+            return "image"
+        if head[8:12] in _ISO_AUDIO_BRANDS:
+            return "audio"
+        return "video"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):  # Matroska / WebM
+        return "video"
+    if head.startswith((b"ID3", b"OggS", b"fLaC", b"#!AMR")):
+        return "audio"
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:  # MPEG audio / ADTS frame sync
+        return "audio"
+    return None
+
+
+def video_duration(path: str) -> Optional[float]:
+    """Duration from the container header (no decoding), None if unknown"""
+    if cv2 is None:
+        return None
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            return None
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        if fps <= 0 or frames <= 0:
+            return None
+        return frames / fps
+    finally:
+        cap.release()
+
+
+def _check_duration(path: str) -> Optional[float]:
+    """video_duration, raising IngestError past MAX_VIDEO_DURATION_SECONDS"""
+    duration = video_duration(path)
+    if duration is not None and duration > MAX_VIDEO_DURATION_SECONDS:
+        raise IngestError(413, f"Video too long (max {int(MAX_VIDEO_DURATION_SECONDS)} s)")
+    return duration
+
+
+def _write(f, digest, chunk: bytes):
+    # Hash and write together in the worker thread; both release the GIL on large buffers
+    digest.update(chunk)
+    f.write(chunk)
+
+
+def _discard(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+async def save_upload(file, dest_path: str, kinds: Iterable[str] = ("image", "video")) -> Dict:
+    """
+    Stream an UploadFile to dest_path in INGEST_CHUNK_SIZE pieces with the file
+    I/O off the event loop. The first chunk's magic number decides the kind (it
+    must be one of kinds), which sets the size cap; a declared or streamed size
+    over the cap stops the upload, and a video longer than
+    MAX_VIDEO_DURATION_SECONDS is rejected once saved. SHA-256 is computed while
+    streaming. A video's duration is probed while it streams (see
+    INGEST_DURATION_PROBE_BYTES), so an over-long one is rejected without
+    waiting for the rest. Raises IngestError (dest_path removed); returns
+    {"path", "sha256", "size", "kind", "duration_seconds"}.
+    """
+    kinds = tuple(kinds)
+    declared = getattr(file, "size", None)
+    if declared is not None and declared > max(MAX_UPLOAD_BYTES[k] for k in kinds):
+        raise IngestError(413, "File too large")
+
+    chunk = await file.read(INGEST_CHUNK_SIZE)
+    kind = sniff(chunk[:16])
+    if kind not in kinds:
+        raise IngestError(415, f"Unsupported file type (expected {' or '.join(kinds)})")
+    limit = MAX_UPLOAD_BYTES[kind]
+    if declared is not None and declared > limit:
+        raise IngestError(413, f"{kind.capitalize()} too large (max {limit // (1024 * 1024)} MB)")
+
+    digest = hashlib.sha256()
+    size = 0
+    duration = None
+    probe_at = INGEST_DURATION_PROBE_BYTES if kind == "video" else None
+    f = await asyncio.to_thread(open, dest_path, "wb")
+    try:
+        while chunk:
+            size += len(chunk)
+            if size > limit:
+                raise IngestError(413, f"{kind.capitalize()} too large (max {limit // (1024 * 1024)} MB)")
+            await asyncio.to_thread(_write, f, digest, chunk)
+            if probe_at is not None and size >= probe_at:
+                await asyncio.to_thread(f.flush)
+                duration = await asyncio.to_thread(_check_duration, dest_path)
+                probe_at = None if duration is not None else probe_at * 4
+            chunk = await file.read(INGEST_CHUNK_SIZE)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        _discard(dest_path)
+        raise
+    await asyncio.to_thread(f.close)
+
+    if kind == "video" and duration is None:
+        try:
+            duration = await asyncio.to_thread(_check_duration, dest_path)
+        except IngestError:
+            _discard(dest_path)
+            raise
+
+    return {
+        "path": dest_path,
+        "sha256": digest.hexdigest(),
+        "size": size,
+        "kind": kind,
+        "duration_seconds": round(duration, 2) if duration is not None else None
+    }
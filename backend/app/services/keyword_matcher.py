@@ -0,0 +1,133 @@
+import re
+from typing import Dict, Iterable, List, Sequence
+
+from app.services.text_normalizer import canonicalize, fold_exact, runs_cover
+
+# Word lists and dynamic terms match as spelled (fold_exact: case, width,
+# homoglyphs and zero-width only), found by one tokenize pass plus a dict
+# lookup, which is linear in the text. Only the obfuscated terms go through
+# the full canonical form (leetspeak, diacritics, repeat collapse) by
+# substring search, which is what r'f+u+c+k+' meant without the regex
+# backtracking.
+_WORD_RE = re.compile(r"\w+")
+
+
+def word_pattern(words: Iterable[str]) -> str:
+    """Legacy regex form of a word group, used as the flag's pattern label"""
+    return r'\b(' + '|'.join(words) + r')\b'
+
+
+def obfuscation_pattern(term: str) -> str:
+    """Legacy regex form of an obfuscated term, e.g. 'fuck' -> 'f+u+c+k+'"""
+    return ''.join(f"{re.escape(c)}+" for c in term)
+
+
+class KeywordMatcher:
+    """
+    Blocklist compiled once into lookup tables over canonical text.
+    word_groups: sequences of whole words, one flag per group (static lists).
+    obfuscated_terms: terms matched anywhere, through padding and repeats.
+    extra_terms: dynamic BlockedTerm values, one flag per term.
+    An obfuscated match only counts if each repeated letter of the term
+    ('ll' in 'kill') is repeated at least as often in the text.
+    """
+
+    def __init__(self, word_groups: Sequence[Sequence[str]] = (), obfuscated_terms: Sequence[str] = (), extra_terms: Sequence[str] = ()):
+        # rule index -> pattern label reported in flags
+        self.patterns: List[str] = []
+        # folded token -> [(rule, term)]
+        self._tokens: Dict[str, List[tuple]] = {}
+        self._obfuscated: List[tuple] = []  # (rule, term, canonical, term runs)
+        self._phrases: Dict[str, List[tuple]] = {}
+        self._phrase_re = None
+
+        for words in word_groups:
+            rule = self._add_rule(word_pattern(words))
+            for w in words:
+                self._add_token(w.lower(), rule)
+
+        for term in obfuscated_terms:
+            rule = self._add_rule(obfuscation_pattern(term))
+            canonical, _, runs = canonicalize(term.lower())
+            self._obfuscated.append((rule, term.lower(), canonical, runs))
+
+        for term in extra_terms:
+            if not term:
+                continue
+            term = term.lower()
+            rule = self._add_rule(rf'\b{re.escape(term)}\b')
+            folded, _ = fold_exact(term)
+            if _WORD_RE.fullmatch(folded):
+                self._tokens.setdefault(folded, []).append((rule, term))
+            elif folded.strip():
+                self._phrases.setdefault(folded, []).append((rule, term))
+
+        if self._phrases:
+            # Longest first so overlapping phrases prefer the most specific one
+            alternation = '|'.join(re.escape(p) for p in sorted(self._phrases, key=len, reverse=True))
+            self._phrase_re = re.compile(rf'\b(?:{alternation})\b')
+
+    def _add_rule(self, pattern: str) -> int:
+        self.patterns.append(pattern)
+        return len(self.patterns) - 1
+
+    def _add_token(self, term: str, rule: int):
+        folded, _ = fold_exact(term)
+        self._tokens.setdefault(folded, []).append((rule, term))
+
+    def match(self, text: str) -> List[Dict]:
+        """Return one keyword_match flag per rule that hit, with per-term hit counts"""
+        if not text:
+            return []
+
+        # rule -> {term: count}, rule -> matched words as written
+        hits: Dict[int, Dict[str, int]] = {}
+        words: Dict[int, List[str]] = {}
+
+        def record(rule: int, term: str, written: str):
+            rule_hits = hits.setdefault(rule, {})
+            rule_hits[term] = rule_hits.get(term, 0) + 1
+            rule_words = words.setdefault(rule, [])
+            if written not in rule_words:
+                rule_words.append(written)
+
+        if self._tokens or self._phrase_re is not None:
+            folded, offsets = fold_exact(text)
+
+            def span(start: int, end: int) -> str:
+                return text[start:end] if offsets is None else text[offsets[start]:offsets[end]]
+
+            if self._tokens:
+                for m in _WORD_RE.finditer(folded):
+                    for rule, term in self._tokens.get(m.group(), ()):
+                        record(rule, term, span(m.start(), m.end()))
+
+            if self._phrase_re is not None:
+                for m in self._phrase_re.finditer(folded):
+                    for rule, term in self._phrases.get(m.group(), ()):
+                        record(rule, term, span(m.start(), m.end()))
+
+        if not self._obfuscated:
+            return self._flags(hits, words)
+        canonical, offsets, runs = canonicalize(text)
+        for rule, term, needle, term_runs in self._obfuscated:
+            pos = canonical.find(needle)
+            while pos >= 0:
+                if runs_cover(runs, pos, term_runs):
+                    record(rule, term, text[offsets[pos]:offsets[pos + len(needle)]])
+                pos = canonical.find(needle, pos + 1)
+
+        return self._flags(hits, words)
+
+    def _flags(self, hits: Dict[int, Dict[str, int]], words: Dict[int, List[str]]) -> List[Dict]:
+        return [
+            {
+                "type": "keyword_match",
+                "label": "KEYWORD_BLOCKED",
+                "score": 1.0,
+                "pattern": self.patterns[rule][:50],
+                "matched_words": words[rule][:3],  # Show up to 3 matched words
+                "hits": hits[rule],
+            }
+            for rule in sorted(hits)
+        ]
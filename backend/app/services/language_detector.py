@@ -0,0 +1,135 @@
+import re
+from bisect import bisect_right
+from typing import Dict
+
+# Returned when there is no usable signal (ISO 639-2 "undetermined")
+UNDETERMINED = "und"
+
+# (first code point, last code point, ISO 639-1 code) for scripts that pin
+# down a language well enough to route translation. Sorted by start.
+_SCRIPT_RANGES = (
+    (0x0370, 0x03FF, "el"),  # Greek
+    (0x0400, 0x04FF, "ru"),  # Cyrillic
+    (0x0590, 0x05FF, "he"),  # Hebrew
+    (0x0600, 0x06FF, "ar"),  # Arabic
+    (0x0900, 0x097F, "hi"),  # Devanagari
+    (0x0980, 0x09FF, "bn"),  # Bengali
+    (0x0A00, 0x0A7F, "pa"),  # Gurmukhi
+    (0x0A80, 0x0AFF, "gu"),  # Gujarati
+    (0x0B80, 0x0BFF, "ta"),  # Tamil
+    (0x0C00, 0x0C7F, "te"),  # Telugu
+    (0x0C80, 0x0CFF, "kn"),  # Kannada
+    (0x0D00, 0x0D7F, "ml"),  # Malayalam
+    (0x0E00, 0x0E7F, "th"),  # Thai
+    (0x1100, 0x11FF, "ko"),  # Hangul Jamo
+    (0x3040, 0x30FF, "ja"),  # Hiragana / Katakana
+    (0x4E00, 0x9FFF, "zh"),  # CJK Unified Ideographs
+    (0xAC00, 0xD7AF, "ko"),  # Hangul Syllables
+)
+_SCRIPT_STARTS = [r[0] for r in _SCRIPT_RANGES]
+
+# Frequent function words per Latin-script language. English is listed first
+# so it wins only when it strictly outscores the rest (ties go to translation).
+# Several ("me", "a", "do") are shared with other languages, so "en", which
+# skips translation altogether, also needs EN_MIN_MARGIN over the runner-up and
+# stopwords making up at least half the words, unless every word is one.
+_STOPWORDS = {
+    "en": {"the", "and", "is", "are", "you", "your", "to", "of", "in", "it", "that", "this", "for", "with", "on",
+           "was", "what", "have", "not", "be", "i", "me", "my", "we", "they", "do", "how", "hi", "hello", "thanks",
+           "please", "can", "will", "just", "so", "but", "at", "from", "good", "yes", "am", "an", "if", "there", "about"},
+    "es": {"el", "los", "las", "que", "y", "un", "una", "es", "por", "para", "con", "lo", "se", "del", "al", "como",
+           "pero", "muy", "hola", "gracias", "está", "qué", "eres", "estoy", "yo", "usted", "bien", "también", "te",
+           "tu", "mi", "su", "voy"},
+    "fr": {"le", "les", "des", "et", "est", "une", "je", "il", "elle", "nous", "vous", "pas", "qui", "dans", "avec",
+           "sur", "ce", "mais", "bonjour", "merci", "oui", "suis", "très", "salut", "au", "aux", "du"},
+    "de": {"der", "die", "das", "und", "ist", "nicht", "ich", "du", "er", "wir", "ein", "eine", "zu", "mit", "auf",
+           "für", "den", "dem", "von", "hallo", "danke", "ja", "nein", "bin", "wie", "sehr", "auch", "bitte"},
+    "pt": {"os", "não", "um", "uma", "você", "obrigado", "obrigada", "olá", "muito", "isso", "tudo", "bem", "sim",
+           "mas", "na", "no", "eu", "ele", "ela", "estou"},
+    "it": {"il", "gli", "di", "che", "è", "non", "sono", "ciao", "grazie", "sei", "questo", "anche", "perché",
+           "molto", "bene", "io", "lei", "lui"},
+    # Romanized Hindi (Hinglish)
+    "hi": {"hai", "hain", "kya", "nahi", "nahin", "tum", "main", "mera", "meri", "tera", "teri", "aap", "kaise",
+           "kyun", "yaar", "bhai", "accha", "acha", "kar", "raha", "rahi", "hoga", "bhi", "aur", "ko", "ki", "ka",
+           "ke", "se", "mujhe", "tujhe", "kuch", "sab", "haan", "tha", "thi", "tu", "ho", "hu", "hoon", "mat",
+           "kyu", "kyon", "bol", "abe", "pagal", "kaisa", "kaisi", "wala", "wali", "yeh", "ye", "woh", "wo", "apna"},
+}
+
+# Letters that only show up in a few Latin-script languages
+_DIACRITIC_HINTS = {
+    "ñ": "es", "¿": "es", "¡": "es",
+    "ß": "de", "ä": "de", "ö": "de", "ü": "de",
+    "ç": "fr", "è": "fr", "ê": "fr", "ë": "fr", "à": "fr", "œ": "fr",
+    "ã": "pt", "õ": "pt",
+    "ì": "it", "ò": "it",
+}
+
+_WORD_RE = re.compile(r"[^\W\d_]+")
+EN_MIN_MARGIN = 2
+
+
+def _script_language(text: str):
+    """Dominant non-Latin script language, or None if the letters are mostly Latin"""
+    counts: Dict[str, int] = {}
+    letters = 0
+    for ch in text:
+        if not ch.isalpha():
+            continue
+        letters += 1
+        cp = ord(ch)
+        if cp < 0x0370:
+            continue  # Latin (basic + extended)
+        i = bisect_right(_SCRIPT_STARTS, cp) - 1
+        if i >= 0 and cp <= _SCRIPT_RANGES[i][1]:
+            lang = _SCRIPT_RANGES[i][2]
+            counts[lang] = counts.get(lang, 0) + 1
+    if not counts:
+        return None
+    lang, n = max(counts.items(), key=lambda kv: kv[1])
+    # Kana mixed with Han is Japanese
+    if lang == "zh" and counts.get("ja"):
+        lang = "ja"
+    return lang if n * 2 >= letters else None
+
+
+def detect_language(text: str) -> str:
+    """
+    Best-effort ISO 639-1 code for text, computed offline in microseconds.
+    Non-Latin scripts map straight to a language; Latin text is scored on
+    function words and diacritics. Returns UNDETERMINED when nothing is
+    conclusive, including ASCII text with no stopword signal (romanized Hindi,
+    short Spanish/French) and text where English leads on too thin a margin
+    ("me voy a matarte"), so the translator gets to decide.
+    """
+    if not text or not text.strip():
+        return UNDETERMINED
+
+    # Emoji and punctuation don't count, only letters
+    is_ascii = text.isascii() or all(ch.isascii() for ch in text if ch.isalpha())
+    if not is_ascii:
+        lang = _script_language(text)
+        if lang:
+            return lang
+
+    lowered = text.lower()
+    scores = dict.fromkeys(_STOPWORDS, 0)
+    tokens = _WORD_RE.findall(lowered)
+    for word in tokens:
+        for lang, words in _STOPWORDS.items():
+            if word in words:
+                scores[lang] += 1
+    if not is_ascii:
+        for ch, lang in _DIACRITIC_HINTS.items():
+            if ch in lowered:
+                scores[lang] += 2
+
+    best = max(scores.values())
+    if best == 0:
+        return UNDETERMINED
+    leaders = [lang for lang, score in scores.items() if score == best]
+    if leaders == ["en"]:
+        runner_up = max(score for lang, score in scores.items() if lang != "en")
+        if best == len(tokens) or (best - runner_up >= EN_MIN_MARGIN and best * 2 >= len(tokens)):
+            return "en"
+        return UNDETERMINED
+    return next(lang for lang in leaders if lang != "en")
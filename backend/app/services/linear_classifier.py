@@ -0,0 +1,69 @@
+import json
+import math
+import os
+import re
+from typing import Dict
+
+# Optional JSON file with trained weights ({"bias": ..., "weights": {feature: w}, "lexicon": [...]}),
+# plus "allow_below"/"block_above" cascade exits when written by fit_linear_classifier.py.
+# Defaults to backend/linear_weights.json if it exists.
+_DEFAULT_WEIGHTS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "linear_weights.json")
+TEXT_LINEAR_WEIGHTS = os.environ.get("TEXT_LINEAR_WEIGHTS") or (_DEFAULT_WEIGHTS_FILE if os.path.exists(_DEFAULT_WEIGHTS_FILE) else None)
+
+# Mildly abusive words that are not hard-blocked but make toxicity likely
+_LEXICON = {
+    "ugly", "dumb", "shut", "trash", "pathetic", "worthless", "disgusting", "moron", "fool", "jerk", "suck",
+    "sucks", "crap", "freak", "creep", "kys", "useless", "clown", "gross", "shame", "liar", "coward", "weak",
+    "fat", "idiots", "losers", "morons", "hell", "screw", "ugh", "annoying", "garbage", "nobody", "hurt",
+}
+_SECOND_PERSON = {"you", "your", "youre", "you're", "ur", "u", "yours", "yourself"}
+
+# Hand-set defaults: benign chit-chat scores near 0, anything with a toxic hint lands mid-range
+_DEFAULT_BIAS = -3.5
+_DEFAULT_WEIGHTS = {
+    "lexicon_hits": 2.5,
+    "second_person": 0.8,
+    "upper_ratio": 1.5,
+    "exclaim_ratio": 2.0,
+    "long_text": 0.7,
+}
+
+_TOKEN_RE = re.compile(r"[\w']+")
+
+
+def _load_weights():
+    if not TEXT_LINEAR_WEIGHTS:
+        return _DEFAULT_BIAS, dict(_DEFAULT_WEIGHTS), set(_LEXICON), None
+    try:
+        with open(TEXT_LINEAR_WEIGHTS) as f:
+            data = json.load(f)
+        calibration = None
+        if "allow_below" in data and "block_above" in data:
+            calibration = {"allow_below": float(data["allow_below"]), "block_above": float(data["block_above"])}
+        return data.get("bias", _DEFAULT_BIAS), {**_DEFAULT_WEIGHTS, **data.get("weights", {})}, set(data.get("lexicon", _LEXICON)), calibration
+    except Exception as e:
+        print(f"Could not load linear weights from {TEXT_LINEAR_WEIGHTS}: {e}")
+        return _DEFAULT_BIAS, dict(_DEFAULT_WEIGHTS), set(_LEXICON), None
+
+
+_bias, _weights, _lexicon, CALIBRATION = _load_weights()
+
+
+def features(text: str) -> Dict[str, float]:
+    tokens = _TOKEN_RE.findall(text.lower())
+    letters = [c for c in text if c.isalpha()]
+    return {
+        "lexicon_hits": float(min(sum(1 for t in tokens if t in _lexicon), 3)),
+        "second_person": 1.0 if any(t in _SECOND_PERSON for t in tokens) else 0.0,
+        "upper_ratio": (sum(1 for c in letters if c.isupper()) / len(letters)) if len(letters) >= 8 else 0.0,
+        "exclaim_ratio": min(text.count("!") / max(len(tokens), 1), 1.0),
+        "long_text": 1.0 if len(tokens) > 30 else 0.0,
+    }
+
+
+def toxicity_score(text: str) -> float:
+    """Probability-like score in [0, 1] from a logistic model over cheap text features"""
+    if not text:
+        return 0.0
+    z = _bias + sum(_weights.get(name, 0.0) * value for name, value in features(text).items())
+    return 1.0 / (1.0 + math.exp(-z))
@@ -0,0 +1,133 @@
+import copy
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from app.services.utils import TTLCache, parse_log_details
+
+# In-process LRU in front of the MediaVerdict table
+MEDIA_VERDICT_CACHE_SIZE = int(os.environ.get("MEDIA_VERDICT_CACHE_SIZE", "5000"))
+MEDIA_VERDICT_CACHE_TTL = float(os.environ.get("MEDIA_VERDICT_CACHE_TTL", "3600"))
+# Stored verdicts older than this are ignored and recomputed (0 keeps them forever)
+MEDIA_VERDICT_MAX_AGE_DAYS = float(os.environ.get("MEDIA_VERDICT_MAX_AGE_DAYS", "30"))
+
+_cache = TTLCache(maxsize=MEDIA_VERDICT_CACHE_SIZE, ttl=MEDIA_VERDICT_CACHE_TTL)
+_db_stats = {"hits": 0, "misses": 0, "writes": 0, "duplicates": 0, "errors": 0}
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get(sha256: str, model_version: str) -> Optional[Dict]:
+    """Stored verdict for these exact bytes under this model version, or None"""
+    key = (sha256, model_version)
+    cached = _cache.get(key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+
+    try:
+        from sqlmodel import Session, select
+        from app.db import engine
+        from app.models import MediaVerdict
+
+        statement = select(MediaVerdict).where(MediaVerdict.sha256 == sha256, MediaVerdict.model_version == model_version)
+        if MEDIA_VERDICT_MAX_AGE_DAYS > 0:
+            statement = statement.where(MediaVerdict.created_at >= datetime.utcnow() - timedelta(days=MEDIA_VERDICT_MAX_AGE_DAYS))
+        with Session(engine) as session:
+            row = session.exec(statement.order_by(MediaVerdict.created_at.desc())).first()
+    except Exception as e:
+        print(f"MediaVerdict lookup failed: {e}")
+        _db_stats["errors"] += 1
+        return None
+
+    if row is None:
+        _db_stats["misses"] += 1
+        return None
+    _db_stats["hits"] += 1
+    result = json.loads(row.result)
+    _cache.set(key, result)
+    return copy.deepcopy(result)
+
+
+def put(sha256: str, kind: str, model_version: str, result: Dict):
+    """
+    Remember a verdict in the LRU and the MediaVerdict table. The unique index
+    on (sha256, model_version) settles concurrent writers: the first one wins.
+    An expired row is replaced.
+    """
+    _cache.set((sha256, model_version), copy.deepcopy(result))
+    try:
+        from sqlalchemy.exc import IntegrityError
+        from sqlmodel import Session, delete
+        from app.db import engine
+        from app.models import MediaVerdict
+
+        with Session(engine) as session:
+            if MEDIA_VERDICT_MAX_AGE_DAYS > 0:
+                session.exec(delete(MediaVerdict).where(
+                    MediaVerdict.sha256 == sha256,
+                    MediaVerdict.model_version == model_version,
+                    MediaVerdict.created_at < datetime.utcnow() - timedelta(days=MEDIA_VERDICT_MAX_AGE_DAYS)
+                ))
+            session.add(MediaVerdict(
+                sha256=sha256,
+                kind=kind,
+                model_version=model_version,
+                is_flagged=bool(result.get("is_flagged")),
+                result=json.dumps(result)
+            ))
+            try:
+                session.commit()
+                _db_stats["writes"] += 1
+            except IntegrityError:
+                session.rollback()
+                _db_stats["duplicates"] += 1
+    except Exception as e:
+        print(f"MediaVerdict write failed: {e}")
+        _db_stats["errors"] += 1
+
+
+def approve(sha256: str) -> int:
+    """
+    A reviewer cleared this content: rewrite its stored verdicts (every model
+    version) as allowed, so re-uploads of the same bytes aren't blocked again.
+    Other workers may serve the old verdict from their LRU for up to
+    MEDIA_VERDICT_CACHE_TTL. Returns the number of rows rewritten.
+    """
+    from sqlmodel import Session, select
+    from app.db import engine
+    from app.models import MediaVerdict
+
+    with Session(engine) as session:
+        rows = session.exec(select(MediaVerdict).where(MediaVerdict.sha256 == sha256)).all()
+        for row in rows:
+            result = json.loads(row.result)
+            result["dismissed_flags"] = result.get("flags", [])
+            result.update(is_flagged=False, flags=[], review_status="dismissed")
+            row.is_flagged = False
+            row.result = json.dumps(result)
+            session.add(row)
+            _cache.set((sha256, row.model_version), copy.deepcopy(result))
+        session.commit()
+    return len(rows)
+
+
+def sha256_from_details(details: Optional[str]) -> Optional[str]:
+    """Digest of the image/video a ModerationLog's details describe, if it was recorded"""
+    data = parse_log_details(details)
+    return data.get("sha256") if isinstance(data, dict) else None
+
+
+def stats() -> Dict:
+    return {"lru": _cache.stats(), "db": dict(_db_stats)}
@@ -0,0 +1,75 @@
+import os
+from typing import List, Union
+
+try:
+    import numpy as np
+    import onnxruntime as ort
+except Exception:
+    np = None
+    ort = None
+
+try:
+    from transformers import AutoConfig, AutoTokenizer
+except Exception:
+    AutoConfig = None
+    AutoTokenizer = None
+
+# Written by export_onnx_model.py; the quantized file is preferred when present
+QUANTIZED_FILE = "model_quantized.onnx"
+FP32_FILE = "model.onnx"
+
+
+class OnnxTextClassifier:
+    """
+    ONNX Runtime stand-in for transformers' text-classification pipeline
+    with return_all_scores=True: same call signature, same label/score output.
+    model_dir holds the exported .onnx file plus tokenizer and config files.
+    """
+
+    def __init__(self, model_dir: str, intra_op_threads: int = 0):
+        if ort is None or AutoTokenizer is None:
+            raise RuntimeError("onnxruntime/transformers not installed")
+        path = os.path.join(model_dir, QUANTIZED_FILE)
+        if not os.path.exists(path):
+            path = os.path.join(model_dir, FP32_FILE)
+        self.model_path = path
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        config = AutoConfig.from_pretrained(model_dir)
+        self.id2label = {int(k): v for k, v in config.id2label.items()}
+        # Same rule the pipeline uses to pick sigmoid vs softmax
+        self.multi_label = config.problem_type == "multi_label_classification" or config.num_labels == 1
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def __call__(self, inputs: Union[str, List[str]], batch_size: int = None, truncation: bool = True, **kwargs) -> List[List[dict]]:
+        single = isinstance(inputs, str)
+        texts = [inputs] if single else list(inputs)
+        batch_size = batch_size or len(texts) or 1
+
+        results = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=truncation,
+                max_length=512,
+                return_tensors="np"
+            )
+            feed = {name: value.astype(np.int64) for name, value in encoded.items() if name in self._input_names}
+            logits = self.session.run(None, feed)[0]
+            if self.multi_label:
+                probs = 1.0 / (1.0 + np.exp(-logits))
+            else:
+                shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+                probs = shifted / shifted.sum(axis=-1, keepdims=True)
+            for row in probs:
+                results.append([{"label": self.id2label[j], "score": float(p)} for j, p in enumerate(row)])
+
+        # Match the pipeline: a single string still yields a one-element list
+        return [results[0]] if single else results
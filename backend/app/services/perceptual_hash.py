@@ -0,0 +1,128 @@
+from typing import Any, List, Optional, Tuple
+
+from PIL import Image
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+# 64-bit hashes, stored and logged as 16 hex characters
+HASH_BITS = 64
+
+
+def _gray(img: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    # Shrink first (reducing_gap keeps large uploads cheap), then drop colour
+    if img.mode not in ("RGB", "RGBA", "L", "LA"):
+        img = img.convert("RGB")  # palette/CMYK etc. can't be resampled bilinearly
+    return img.resize(size, Image.BILINEAR, reducing_gap=2.0).convert("L")
+
+
+def dhash(img: Image.Image) -> int:
+    """Difference hash: one bit per horizontally adjacent pixel pair of a 9x8 thumbnail"""
+    pixels = list(_gray(img, (9, 8)).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+
+_DCT = None
+
+
+def _dct_matrix(n: int = 32):
+    global _DCT
+    if _DCT is None:
+        k = np.arange(n).reshape(-1, 1)
+        m = np.cos(np.pi * (2 * np.arange(n) + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+        m[0] /= np.sqrt(2.0)
+        _DCT = m
+    return _DCT
+
+
+def phash(img: Image.Image) -> Optional[int]:
+    """DCT hash: low 8x8 frequencies of a 32x32 thumbnail against their median (None without NumPy)"""
+    if np is None:
+        return None
+    pixels = np.asarray(_gray(img, (32, 32)), dtype=np.float64)
+    dct = _dct_matrix()
+    low = (dct @ pixels @ dct.T)[:8, :8].flatten()
+    bits = low > np.median(low[1:])  # DC term excluded from the median
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def to_hex(value: Optional[int]) -> Optional[str]:
+    return None if value is None else f"{value:016x}"
+
+
+def from_hex(value: Optional[str]) -> Optional[int]:
+    return int(value, 16) if value else None
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing over Hamming distance. Each 64-bit hash is split into
+    CHUNKS 16-bit pieces with one dict per piece. If two hashes are within
+    radius, then by pigeonhole some piece differs in at most radius // CHUNKS
+    bits. A search therefore probes every piece's dict with all values that
+    close (137 per piece at radius 10) and checks only the candidates it finds.
+    """
+
+    CHUNKS = 4
+    CHUNK_BITS = HASH_BITS // CHUNKS
+
+    def __init__(self):
+        self._tables = [{} for _ in range(self.CHUNKS)]  # piece value -> [hash]
+        self._values = {}  # hash -> [values]
+        self._masks = {}  # flips allowed per piece -> XOR masks
+        self.size = 0
+
+    def _pieces(self, value_hash: int) -> List[int]:
+        mask = (1 << self.CHUNK_BITS) - 1
+        return [(value_hash >> (i * self.CHUNK_BITS)) & mask for i in range(self.CHUNKS)]
+
+    def _flip_masks(self, flips: int) -> List[int]:
+        masks = self._masks.get(flips)
+        if masks is None:
+            masks = [0]
+            for _ in range(flips):
+                masks = sorted({m | (1 << b) for m in masks for b in range(self.CHUNK_BITS)} | set(masks))
+            self._masks[flips] = masks
+        return masks
+
+    def add(self, value_hash: int, value: Any):
+        self.size += 1
+        entries = self._values.get(value_hash)
+        if entries is not None:
+            entries.append(value)
+            return
+        self._values[value_hash] = [value]
+        for table, piece in zip(self._tables, self._pieces(value_hash)):
+            table.setdefault(piece, []).append(value_hash)
+
+    def search(self, query: int, radius: int) -> List[Tuple[int, Any]]:
+        """(distance, value) for every entry within radius, nearest first"""
+        if not self.size:
+            return []
+        masks = self._flip_masks(radius // self.CHUNKS)
+        candidates = set()
+        for table, piece in zip(self._tables, self._pieces(query)):
+            for m in masks:
+                hashes = table.get(piece ^ m)
+                if hashes:
+                    candidates.update(hashes)
+        found = []
+        for h in candidates:
+            d = hamming(query, h)
+            if d <= radius:
+                found.extend((d, v) for v in self._values[h])
+        found.sort(key=lambda item: item[0])
+        return found
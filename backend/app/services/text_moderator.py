@@ -1,5 +1,17 @@
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import copy
+import os
 import re
+import threading
+import time
+from app.services.keyword_matcher import KeywordMatcher, word_pattern, obfuscation_pattern
+from app.services.utils import TTLCache, text_hash
+from app.services.language_detector import detect_language, UNDETERMINED
+from app.services import linear_classifier
+from app.services.linear_classifier import toxicity_score
+from app.services.cascade import Cascade, ALLOW, BLOCK, UNCERTAIN
+from app.services.batcher import MICROBATCH_ENABLED, get_batcher
 
 try:
     from transformers import pipeline
@@ -7,149 +19,560 @@ except Exception:
     pipeline = None
 
 _model = None
+TEXT_MODEL_NAME = os.environ.get("TEXT_MODEL_NAME", "unitary/toxic-bert")
+# "pytorch" (transformers pipeline) or "onnx" (int8 export from export_onnx_model.py)
+TEXT_MODEL_BACKEND = os.environ.get("TEXT_MODEL_BACKEND", "pytorch").lower()
+TEXT_ONNX_DIR = os.environ.get("TEXT_ONNX_DIR", "models/toxic-bert-onnx")
+TEXT_ONNX_THREADS = int(os.environ.get("TEXT_ONNX_THREADS", "0"))  # 0 = onnxruntime default
+
+# Labels from unitary/toxic-bert that count as a violation
+TOXIC_LABELS = ('toxic', 'obscene', 'threat', 'severe_toxic', 'identity_hate', 'insult')
+TOXIC_THRESHOLD = 0.5
+# Inputs per forward pass for batched moderation
+MODEL_BATCH_SIZE = int(os.environ.get("TEXT_MODEL_BATCH_SIZE", "32"))
+# Long texts are scored in overlapping token windows (512 minus [CLS]/[SEP])
+TEXT_WINDOW_TOKENS = int(os.environ.get("TEXT_WINDOW_TOKENS", "510"))
+TEXT_WINDOW_OVERLAP = int(os.environ.get("TEXT_WINDOW_OVERLAP", "64"))
+TEXT_WINDOW_BATCH = int(os.environ.get("TEXT_WINDOW_BATCH", "8"))
+# Ordered cascade stages. "linear" runs by default only with calibrated weights
+# (fit_linear_classifier.py); the hand-set defaults let non-lexicon hate/violence through
+_LINEAR_CALIBRATION = linear_classifier.CALIBRATION
+_DEFAULT_STAGES = "keywords,translated_keywords,linear,model" if _LINEAR_CALIBRATION else "keywords,translated_keywords,model"
+TEXT_CASCADE_STAGES = [s.strip() for s in os.environ.get("TEXT_CASCADE_STAGES", _DEFAULT_STAGES).split(",") if s.strip()]
+# Linear pre-filter exits: below ALLOW skips the model, at/above BLOCK flags without it
+# (0 / >1 disable them). Default to the calibrated thresholds, else disabled.
+LINEAR_ALLOW_BELOW = float(os.environ.get("TEXT_LINEAR_ALLOW_BELOW", (_LINEAR_CALIBRATION or {}).get("allow_below", 0)))
+LINEAR_BLOCK_ABOVE = float(os.environ.get("TEXT_LINEAR_BLOCK_ABOVE", (_LINEAR_CALIBRATION or {}).get("block_above", 1.01)))
+
+
+def _model_version(backend: str) -> str:
+    return f"{TEXT_MODEL_NAME}:{backend}@{TOXIC_THRESHOLD}|{','.join(TEXT_CASCADE_STAGES)}|{LINEAR_ALLOW_BELOW}-{LINEAR_BLOCK_ABOVE}"
+
+
+# Part of the verdict cache key; anything that changes verdicts belongs here.
+# Starts from the configured backend and is rebuilt by _load_model from the one
+# that actually loaded (ONNX can fall back to PyTorch, or to keywords only: "none").
+MODEL_VERSION = _model_version(TEXT_MODEL_BACKEND)
 
 try:
     from deep_translator import GoogleTranslator
 except Exception:
     GoogleTranslator = None
 
-# List of inappropriate keywords/patterns
-BLOCKED_KEYWORDS = {
+# One translator per thread: GoogleTranslator.translate() keeps the request
+# parameters on the instance, so a shared one mixes up concurrent calls
+_translator_local = threading.local()
+# Translations keyed by normalized text hash; greetings and common phrases repeat a lot
+_translation_cache = TTLCache(
+    maxsize=int(os.environ.get("TRANSLATION_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("TRANSLATION_CACHE_TTL", "86400"))
+)
+# Concurrent translator calls when moderate_texts has several texts to translate
+TRANSLATION_WORKERS = int(os.environ.get("TRANSLATION_WORKERS", "8"))
+_translate_pool = None
+_translate_pool_lock = threading.Lock()
+
+# Inappropriate keywords, one group per category
+KEYWORD_GROUPS = (
     # English - Sexual/Nudity
-    r'\b(porn|xxx|nsfw|nude|naked|sex|sexual|orgasm|masturbat|dick|pussy|cock|vagina|penis|boobs|tits)\b',
+    ('porn', 'xxx', 'nsfw', 'nude', 'naked', 'sex', 'sexual', 'orgasm', 'masturbat', 'dick', 'pussy', 'cock', 'vagina', 'penis', 'boobs', 'tits'),
     # English - Abusive/Offensive
-    r'\b(fuck|shit|damn|bastard|asshole|bitch|slut|whore|cunt|nigger|nigga|faggot|dyke|retard|idiot|stupid|dumbass|loser|scum)\b',
+    ('fuck', 'shit', 'damn', 'bastard', 'asshole', 'bitch', 'slut', 'whore', 'cunt', 'nigger', 'nigga', 'faggot', 'dyke', 'retard', 'idiot', 'stupid', 'dumbass', 'loser', 'scum'),
     # English - Violence/Hate
-    r'\b(kill|murder|suicide|terrorist|hate|racist|homophobic|rapist|rape|die)\b',
+    ('kill', 'murder', 'suicide', 'terrorist', 'hate', 'racist', 'homophobic', 'rapist', 'rape', 'die'),
     # English - Drug related
-    r'\b(cocaine|heroin|meth|weed|drugs|dealer|marijuana|lsd|ecstasy)\b',
-    
+    ('cocaine', 'heroin', 'meth', 'weed', 'drugs', 'dealer', 'marijuana', 'lsd', 'ecstasy'),
+
     # Hindi / Hinglish
-    r'\b(madarchod|bhenchod|benchod|bc|mc|bkl|mkc|tmkc|mkm|chutiya|kamina|kutta|kutti|saala|sale|harami|bhosdike|bhosda|gand|gaand|gandu|lund|loda|lawda|lavde|choot|chut|randi|raand|bhadwa|launda|suwar|chinaal|betichod|jhant)\b',
-    
+    ('madarchod', 'bhenchod', 'benchod', 'bc', 'mc', 'bkl', 'mkc', 'tmkc', 'mkm', 'chutiya', 'kamina', 'kutta', 'kutti', 'saala', 'sale', 'harami', 'bhosdike', 'bhosda', 'gand', 'gaand', 'gandu', 'lund', 'loda', 'lawda', 'lavde', 'choot', 'chut', 'randi', 'raand', 'bhadwa', 'launda', 'suwar', 'chinaal', 'betichod', 'jhant'),
+
     # Spanish
-    r'\b(puta|mierda|cabron|pendejo|coño|gilipollas|zorra|maricon|chinga)\b',
-    
+    ('puta', 'mierda', 'cabron', 'pendejo', 'coño', 'gilipollas', 'zorra', 'maricon', 'chinga'),
+
     # French
-    r'\b(merde|putain|connard|salope|batard|encule)\b',
-    
+    ('merde', 'putain', 'connard', 'salope', 'batard', 'encule'),
+
     # German
-    r'\b(scheisse|arschloch|schlampe|fotze|verdammt)\b',
+    ('scheisse', 'arschloch', 'schlampe', 'fotze', 'verdammt'),
+)
 
-    # Variations/Obfuscations
-    r'f+u+c+k+',
-    r's+h+i+t+',
-    r'b+i+t+c+h+',
-}
+# Variations/Obfuscations (matched through repeated letters, e.g. 'ffuuuck')
+OBFUSCATED_KEYWORDS = ('fuck', 'shit', 'bitch')
+
+# Regex form of the lists above, kept for callers that inspect the patterns
+BLOCKED_KEYWORDS = {word_pattern(words) for words in KEYWORD_GROUPS} | {obfuscation_pattern(t) for t in OBFUSCATED_KEYWORDS}
+
+# (explicit dynamic terms, compiled matcher); rebuilt only when the terms change
+_matcher_cache = None
+
+# Final verdicts keyed by (normalized text hash, blocklist generation, MODEL_VERSION)
+_verdict_cache = TTLCache(
+    maxsize=int(os.environ.get("VERDICT_CACHE_SIZE", "50000")),
+    ttl=float(os.environ.get("VERDICT_CACHE_TTL", "3600"))
+)
+_verdict_generation = None
+# Guards the generation check + clear and every store, so no verdict lands under a stale generation
+_verdict_lock = threading.Lock()
+
+def _get_translator():
+    translator = getattr(_translator_local, "translator", None)
+    if translator is None:
+        translator = _translator_local.translator = GoogleTranslator(source='auto', target='en')
+    return translator
 
 def _translate_to_english(text: str) -> dict:
     try:
-        # Detect is not strictly needed if we just translate to 'en', google handles it.
-        # But to know if we translated, we check input vs output or use explicit detection (which requires key or lib)
-        # GoogleTranslator(source='auto', target='en') works well.
+        # Offline detection first: English (most traffic) never reaches the translator
+        detected = detect_language(text)
+        if detected == "en":
+            return {"text": text, "original_language": "en"}
+        if not any(ch.isalpha() for ch in text):
+            return {"text": text, "original_language": detected}  # Emoji/numbers only: nothing to translate
+
         if GoogleTranslator is None:
-             return {"text": text, "original_language": "unknown"}
+             return {"text": text, "original_language": detected}
+
+        key = text_hash(text)
+        cached = _translation_cache.get(key)
+        if cached is not None:
+            if cached["original_language"] == "en":
+                return {"text": text, "original_language": "en"}
+            return dict(cached)
 
-        translator = GoogleTranslator(source='auto', target='en')
-        translated = translator.translate(text)
+        translated = _get_translator().translate(text)
         
-        # Simple heuristic to guess if it was translated (not perfect but good enough for MVP)
-        # Or we rely on the fact that if it changed significantly, it was likely another language.
-        original_lang = "unknown" # Deep translator doesn't easily return detected lang in one call without extra tools
-        if translated != text:
-             original_lang = "detected_non_english"
-        else:
-             original_lang = "en"
+        # Unchanged output means the translator saw it as English already
+        original_lang = detected if translated != text else "en"
              
-        return {"text": translated, "original_language": original_lang}
+        result = {"text": translated, "original_language": original_lang}
+        _translation_cache.set(key, result)  # Errors below are not cached
+        return dict(result)
     except Exception as e:
         print(f"Translation error: {e}")
         return {"text": text, "original_language": "error"}
 
-def _load_model(model_name="unitary/toxic-bert"):
-    global _model
+def _init_translate_worker():
+    # Each pool thread owns its translator (see _translator_local); built up front, not mid-batch
+    try:
+        _get_translator()
+    except Exception as e:
+        print(f"Translator init failed: {e}")
+
+def _get_translate_pool() -> ThreadPoolExecutor:
+    global _translate_pool
+    with _translate_pool_lock:
+        if _translate_pool is None:
+            _translate_pool = ThreadPoolExecutor(
+                max_workers=TRANSLATION_WORKERS, thread_name_prefix="translate", initializer=_init_translate_worker
+            )
+    return _translate_pool
+
+def _translate_many(texts: List[str]) -> Dict[str, dict]:
+    """text_hash -> _translate_to_english result, each distinct text translated once, concurrently"""
+    by_hash = {}
+    for text in texts:
+        by_hash.setdefault(text_hash(text), text)
+    if len(by_hash) < 2 or GoogleTranslator is None:
+        return {key: _translate_to_english(text) for key, text in by_hash.items()}
+    futures = {key: _get_translate_pool().submit(_translate_to_english, text) for key, text in by_hash.items()}
+    return {key: future.result() for key, future in futures.items()}
+
+def load_text_classifier(backend: str = None, model_name: str = TEXT_MODEL_NAME):
+    """Build a classifier for the given backend ("pytorch" pipeline or int8 "onnx"); raises on failure"""
+    backend = backend or TEXT_MODEL_BACKEND
+    if backend == "onnx":
+        from app.services.onnx_classifier import OnnxTextClassifier
+        return OnnxTextClassifier(TEXT_ONNX_DIR, intra_op_threads=TEXT_ONNX_THREADS)
+    if pipeline is None:
+        raise RuntimeError("transformers not installed")
+    return pipeline("text-classification", model=model_name, return_all_scores=True)
+
+def _load_model(model_name=TEXT_MODEL_NAME):
+    global _model, MODEL_VERSION
     if _model is None:
+        if TEXT_MODEL_BACKEND == "onnx":
+            try:
+                _model = load_text_classifier("onnx", model_name)
+                MODEL_VERSION = _model_version("onnx")
+                return _model
+            except Exception as e:
+                print(f"ONNX text model unavailable ({e}), falling back to the PyTorch pipeline")
         if pipeline is None:
             # Fallback: Just return False (failed to load) so we rely on keywords only
             # raise RuntimeError("transformers not installed") 
             _model = False
+            MODEL_VERSION = _model_version("none")
             return _model
         try:
-            _model = pipeline("text-classification", model=model_name, return_all_scores=True)
+            _model = load_text_classifier("pytorch", model_name)
+            MODEL_VERSION = _model_version("pytorch")
         except:
             _model = False  # Mark as failed so we don't retry
+            MODEL_VERSION = _model_version("none")
     return _model
 
-def _check_keywords(text: str, additional_keywords: list = None) -> Dict:
-    """Check for blocked keywords using regex patterns"""
-    flags = []
-    
-    # Merge static and dynamic patterns
-    patterns = BLOCKED_KEYWORDS.copy()
-    if additional_keywords:
-        for kw in additional_keywords:
-            if not kw: continue
-            patterns.add(rf'\b{re.escape(kw)}\b')
-
-    for pattern in patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        if matches:
-            flags.append({
-                "type": "keyword_match",
-                "label": "KEYWORD_BLOCKED",
-                "score": 1.0,
-                "pattern": pattern[:50],
-                "matched_words": list(set(matches))[:3]  # Show up to 3 matched words
-            })
+def build_matcher(terms=()) -> KeywordMatcher:
+    """Compile the static lists plus the given dynamic terms"""
+    return KeywordMatcher(KEYWORD_GROUPS, OBFUSCATED_KEYWORDS, terms)
+
+def _resolve_blocklist(additional_keywords: list = None):
+    """
+    (matcher, generation) for the given dynamic terms, or for the shared
+    in-memory blocklist (BlockedTerm table) when no terms are passed.
+    generation is None for explicit terms, which are not verdict-cached.
+    """
+    global _matcher_cache
+    if additional_keywords is None:
+        from app.services import blocklist_cache
+        generation, _, matcher = blocklist_cache.snapshot()
+        return matcher, generation
+
+    terms = tuple(sorted({kw.lower() for kw in additional_keywords if kw}))
+    cache = _matcher_cache
+    if cache is None or cache[0] != terms:
+        cache = (terms, build_matcher(terms))
+        _matcher_cache = cache
+    return cache[1], None
+
+def _get_matcher(additional_keywords: list = None) -> KeywordMatcher:
+    return _resolve_blocklist(additional_keywords)[0]
+
+def _verdict_key(text: str, generation: int):
+    global _verdict_generation
+    with _verdict_lock:
+        if generation != _verdict_generation:
+            # Blocklist changed: every cached verdict is stale
+            _verdict_cache.clear()
+            _verdict_generation = generation
+    return (text_hash(text), generation, MODEL_VERSION)
+
+def _cache_verdict(key, result: Dict):
+    with _verdict_lock:
+        # The blocklist moved on, or the model resolved to another backend,
+        # while this verdict was computed: don't store it under the old key
+        if key[1] == _verdict_generation and key[2] == MODEL_VERSION:
+            _verdict_cache.set(key, copy.deepcopy(result))
+
+def _is_cacheable(result: Dict, ctx: Dict = None) -> bool:
+    # Don't pin transient failures (translator/model errors), nor an allow the model never checked
+    if ctx is not None and ctx.get("model_unavailable"):
+        return False
+    return "error" not in result and result.get("original_language") != "error"
+
+def get_cache_stats() -> Dict:
+    return {
+        "verdicts": _verdict_cache.stats(),
+        "translations": _translation_cache.stats(),
+        "blocklist_generation": _verdict_generation,
+        "model_version": MODEL_VERSION,
+    }
+
+def _check_keywords(text: str, additional_keywords: list = None, matcher: KeywordMatcher = None) -> Dict:
+    """Check for blocked keywords using the compiled matcher"""
+    if matcher is None:
+        matcher = _get_matcher(additional_keywords)
+    flags = matcher.match(text)
     return {"is_flagged": len(flags) > 0, "flags": flags}
 
+def _stage_keywords(ctx: Dict) -> str:
+    # 0. Check ORIGINAL text for Hinglish/Specific keywords (Best for exact matches like 'madarchod')
+    keyword_result_original = _check_keywords(ctx["text"], matcher=ctx["matcher"])
+    if keyword_result_original["is_flagged"]:
+         keyword_result_original["original_language"] = "original_match"
+         ctx["result"] = keyword_result_original
+         return BLOCK
+    return UNCERTAIN
+
+def _stage_translated_keywords(ctx: Dict) -> str:
+    # 1. Translate to English (moderate_texts translates its batch up front)
+    trans_res = ctx.get("translation") or _translate_to_english(ctx["text"])
+    text_to_check = ctx["text_to_check"] = trans_res["text"]
+    original_lang = ctx["original_language"] = trans_res["original_language"]
+
+    # 2. Keywork Check on TRANSLATED text
+    keyword_result = _check_keywords(text_to_check, matcher=ctx["matcher"])
+    if keyword_result["is_flagged"]:
+        keyword_result["original_language"] = original_lang
+        keyword_result["translated_text"] = text_to_check if original_lang != "en" else None
+        ctx["result"] = keyword_result
+        return BLOCK
+    return UNCERTAIN
+
+def _stage_linear(ctx: Dict) -> str:
+    # Cheap logistic pre-filter: clearly benign text skips the transformer
+    score = toxicity_score(ctx["text_to_check"])
+    if score < LINEAR_ALLOW_BELOW:
+        ctx["result"] = _model_result([], ctx["original_language"], ctx["text_to_check"])
+        return ALLOW
+    if score >= LINEAR_BLOCK_ABOVE:
+        flags = [{"type": "linear_model", "label": "toxic", "score": round(score, 3)}]
+        ctx["result"] = _model_result(flags, ctx["original_language"], ctx["text_to_check"])
+        return BLOCK
+    return UNCERTAIN
+
+def _stage_model(ctx: Dict) -> str:
+    # 3. Model Check (long texts are scored in overlapping token windows)
+    flags = []
+    model = _load_model()
+    if model and model != False:
+        windows = _text_windows(model, ctx["text"])
+        if len(windows) == 1:
+            scores = _classify(model, windows[0])
+        else:
+            scores = _score_windows(model, windows)
+        flags = _model_flags(scores)
+    else:
+        ctx["model_unavailable"] = True  # Keyword-only allow: fine to return, not to cache
+    return _finish_model_stage(ctx, flags)
+
+def _finish_model_stage(ctx: Dict, flags: list) -> str:
+    ctx["result"] = _model_result(flags, ctx["original_language"], ctx["text_to_check"])
+    return BLOCK if flags else ALLOW
+
+_STAGES = {
+    "keywords": _stage_keywords,
+    "translated_keywords": _stage_translated_keywords,
+    "linear": _stage_linear,
+    "model": _stage_model,
+}
+_cascade = Cascade("text", [(name, _STAGES[name]) for name in TEXT_CASCADE_STAGES if name in _STAGES])
+
+def get_cascade_stats() -> Dict:
+    return _cascade.stats()
+
+def _model_flags(scores: list) -> list:
+    """Turn one input's label scores from the toxic-bert pipeline into flags"""
+    flags = []
+    for o in scores:
+        label = o.get('label')
+        score = float(o.get('score', 0))
+        if label.lower() in TOXIC_LABELS and score >= TOXIC_THRESHOLD:
+            flags.append({"type": "ml_model", "label": label, "score": round(score, 3)})
+    return flags
+
+def _model_result(flags: list, original_lang: str, text_to_check: str) -> Dict:
+    if flags:
+        return {
+            "is_flagged": True, 
+            "flags": flags,
+            "original_language": original_lang,
+            "translated_text": text_to_check if original_lang != "en" else None
+        }
+    return {
+        "is_flagged": False, 
+        "flags": [],
+        "original_language": original_lang
+    }
+
+def _new_context(text: str, matcher: KeywordMatcher) -> Dict:
+    # Defaults cover cascades configured without the translation stage
+    return {"text": text, "matcher": matcher, "text_to_check": text, "original_language": UNDETERMINED, "result": None, "model_unavailable": False}
+
 def moderate_text(text: str, additional_keywords: list = None) -> Dict:
     if not text:
         return {"is_flagged": False, "flags": []}
     
     try:
-        # 0. Check ORIGINAL text for Hinglish/Specific keywords (Best for exact matches like 'madarchod')
-        keyword_result_original = _check_keywords(text, additional_keywords)
-        if keyword_result_original["is_flagged"]:
-             keyword_result_original["original_language"] = "original_match"
-             return keyword_result_original
-
-        # 1. Translate to English
-        trans_res = _translate_to_english(text)
-        text_to_check = trans_res["text"]
-        original_lang = trans_res["original_language"]
-
-        # 2. Keywork Check on TRANSLATED text
-        keyword_result = _check_keywords(text_to_check, additional_keywords)
-        if keyword_result["is_flagged"]:
-            keyword_result["original_language"] = original_lang
-            keyword_result["translated_text"] = text_to_check if original_lang != "en" else None
-            return keyword_result
-        
-        # 3. Model Check
-        model = _load_model()
-        if model and model != False:
-            outputs = model(text[:512])  # Limit text length for model
-            flags = []
-            is_flagged = False
-            for o in outputs[0]:
-                label = o.get('label')
-                score = float(o.get('score', 0))
-                if label.lower() in ['toxic', 'obscene', 'threat', 'severe_toxic', 'identity_hate', 'insult'] and score >= 0.5:
-                    is_flagged = True
-                    flags.append({"type": "ml_model", "label": label, "score": round(score, 3)})
-            if is_flagged:
-                return {
-                    "is_flagged": True, 
-                    "flags": flags,
-                    "original_language": original_lang,
-                    "translated_text": text_to_check if original_lang != "en" else None
-                }
-        
-        return {
-            "is_flagged": False, 
-            "flags": [],
-            "original_language": original_lang
-        }
+        matcher, generation = _resolve_blocklist(additional_keywords)
+        key = _verdict_key(text, generation) if generation is not None else None
+        if key is not None:
+            cached = _verdict_cache.get(key)
+            if cached is not None:
+                return copy.deepcopy(cached)
+
+        ctx = _moderate_uncached(text, matcher)
+        result = ctx["result"]
+        if key is not None and _is_cacheable(result, ctx):
+            _cache_verdict(key, result)
+        return result
     except Exception as e:
         return {"error": str(e), "is_flagged": False}
+
+def _moderate_uncached(text: str, matcher: KeywordMatcher) -> Dict:
+    """Run the cascade; returns the context, with the verdict in ctx["result"]"""
+    ctx = _new_context(text, matcher)
+    _cascade.run(ctx)
+    if ctx["result"] is None:
+        # Every configured stage was uncertain: allow, as when the model is unavailable
+        ctx["result"] = _model_result([], ctx["original_language"], ctx["text_to_check"])
+    return ctx
+
+def _text_windows(model, text: str) -> List[str]:
+    """
+    Split text into windows of at most TEXT_WINDOW_TOKENS tokens, overlapping
+    by TEXT_WINDOW_OVERLAP, so nothing past the model's limit goes unscored.
+    Short texts come back as a single window without tokenizing.
+    """
+    # WordPiece never yields fewer characters than tokens
+    if len(text) <= TEXT_WINDOW_TOKENS:
+        return [text]
+    size = TEXT_WINDOW_TOKENS
+    try:
+        spans = model.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    except Exception:
+        return _word_windows(model, text)
+    if len(spans) <= size:
+        return [text]
+
+    step = max(size - TEXT_WINDOW_OVERLAP, 1)
+    windows = []
+    for start in range(0, len(spans), step):
+        piece = spans[start:start + size]
+        windows.append(text[piece[0][0]:piece[-1][1]])
+        if start + size >= len(spans):
+            break
+    return windows
+
+def _count_tokens(model, word: str) -> int:
+    try:
+        return max(len(model.tokenizer.tokenize(word)), 1)
+    except Exception:
+        return len(word)  # WordPiece never yields more tokens than characters
+
+def _word_windows(model, text: str) -> List[str]:
+    """
+    _text_windows for tokenizers without offsets: whole words packed up to
+    TEXT_WINDOW_TOKENS by each word's own token count, overlapping by about
+    TEXT_WINDOW_OVERLAP tokens. A single word over the limit is left to truncation.
+    """
+    words = [(m.start(), m.end(), _count_tokens(model, m.group())) for m in re.finditer(r"\S+", text)]
+    if sum(n for _, _, n in words) <= TEXT_WINDOW_TOKENS:
+        return [text]
+
+    windows = []
+    start = 0
+    while start < len(words):
+        end, used = start, 0
+        while end < len(words) and (end == start or used + words[end][2] <= TEXT_WINDOW_TOKENS):
+            used += words[end][2]
+            end += 1
+        windows.append(text[words[start][0]:words[end - 1][1]])
+        if end >= len(words):
+            break
+        # Step back over the tail words that fit in the overlap, always moving forward
+        back, overlap = end, 0
+        while back - 1 > start and overlap + words[back - 1][2] <= TEXT_WINDOW_OVERLAP:
+            back -= 1
+            overlap += words[back][2]
+        start = back
+    return windows
+
+def _pool_scores(window_scores: List[list]) -> list:
+    """Max-pool each label's score across windows"""
+    best: Dict[str, float] = {}
+    for scores in window_scores:
+        for o in scores:
+            label = o.get('label')
+            score = float(o.get('score', 0))
+            if score > best.get(label, -1.0):
+                best[label] = score
+    return [{"label": label, "score": score} for label, score in best.items()]
+
+def _score_windows(model, windows: List[str]) -> list:
+    """Score windows TEXT_WINDOW_BATCH at a time, stopping once any crosses the threshold"""
+    scored = []
+    for start in range(0, len(windows), TEXT_WINDOW_BATCH):
+        batch = windows[start:start + TEXT_WINDOW_BATCH]
+        outputs = model(batch, batch_size=len(batch), truncation=True)
+        scored.extend(outputs)
+        if _model_flags(_pool_scores(outputs)):
+            break
+    return _pool_scores(scored)
+
+def _classify(model, text: str) -> list:
+    """Label scores for one input; concurrent callers share one forward pass via the micro-batcher"""
+    if not MICROBATCH_ENABLED:
+        return model(text, truncation=True)[0]
+    batcher = get_batcher("text", lambda items: model(items, batch_size=len(items), truncation=True))
+    return batcher(text)
+
+def moderate_texts(texts: List[str], additional_keywords: list = None, batch_size: int = MODEL_BATCH_SIZE) -> List[Dict]:
+    """
+    Moderate many texts at once. Every item goes through the cheap cascade
+    stages; only the items still uncertain are sent to the model, batch_size
+    at a time. Returns one result per input, in order, shaped like moderate_text's.
+    """
+    results: List[Dict] = [None] * len(texts)
+    keys = [None] * len(texts)
+    pending = []  # (index, cascade context) for the model stage
+    matcher, generation = _resolve_blocklist(additional_keywords)
+    # Translation is the slow network stage: stop before it, translate the
+    # distinct survivors concurrently, then resume each item from there
+    translate = _cascade.has_stage("translated_keywords")
+    contexts = []  # (index, cascade context) still uncertain
+
+    for i, text in enumerate(texts):
+        if not text:
+            results[i] = {"is_flagged": False, "flags": []}
+            continue
+        if generation is not None:
+            keys[i] = _verdict_key(text, generation)
+            cached = _verdict_cache.get(keys[i])
+            if cached is not None:
+                results[i] = copy.deepcopy(cached)
+                continue
+        ctx = _new_context(text, matcher)
+        contexts.append((i, ctx))
+
+    if translate:
+        early = []
+        for i, ctx in contexts:
+            try:
+                if _cascade.run(ctx, stop_before="translated_keywords") == UNCERTAIN and ctx["result"] is None:
+                    early.append((i, ctx))
+                    continue
+            except Exception as e:
+                results[i] = {"error": str(e), "is_flagged": False}
+                continue
+            results[i] = ctx["result"]
+            if keys[i] is not None and _is_cacheable(results[i], ctx):
+                _cache_verdict(keys[i], results[i])
+        contexts = early
+        translations = _translate_many([ctx["text"] for _, ctx in contexts])
+        for _, ctx in contexts:
+            ctx["translation"] = dict(translations[text_hash(ctx["text"])])
+
+    for i, ctx in contexts:
+        try:
+            _cascade.run(ctx, stop_before="model", start_at="translated_keywords" if translate else None)
+        except Exception as e:
+            results[i] = {"error": str(e), "is_flagged": False}
+            continue
+        if ctx["result"] is not None:
+            results[i] = ctx["result"]
+            if keys[i] is not None and _is_cacheable(results[i], ctx):
+                _cache_verdict(keys[i], results[i])
+        elif _cascade.has_stage("model"):
+            pending.append((i, ctx))
+        else:
+            results[i] = _model_result([], ctx["original_language"], ctx["text_to_check"])
+
+    model = _load_model() if pending else None
+    for start in range(0, len(pending), batch_size):
+        chunk = pending[start:start + batch_size]
+        scores = {i: [] for i, _ in chunk}  # item index -> per-window label scores
+        started = time.perf_counter()
+        if model and model != False:
+            try:
+                # Long items contribute several windows; all go through padded forward passes together
+                windows = [(i, w) for i, _ in chunk for w in _text_windows(model, texts[i])]
+                for w_start in range(0, len(windows), batch_size):
+                    part = windows[w_start:w_start + batch_size]
+                    outputs = model([w for _, w in part], batch_size=batch_size, truncation=True)
+                    for (i, _), output in zip(part, outputs):
+                        scores[i].append(output)
+            except Exception as e:
+                for i, _ in chunk:
+                    results[i] = {"error": str(e), "is_flagged": False}
+                continue
+        per_item_ms = (time.perf_counter() - started) * 1000 / len(chunk)
+        for i, ctx in chunk:
+            if not (model and model != False):
+                ctx["model_unavailable"] = True
+            decision = _finish_model_stage(ctx, _model_flags(_pool_scores(scores[i])))
+            _cascade.record("model", decision, per_item_ms)
+            results[i] = ctx["result"]
+            if keys[i] is not None and _is_cacheable(results[i], ctx):
+                _cache_verdict(keys[i], results[i])
+
+    return results
@@ -0,0 +1,115 @@
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+
+# Invisible characters used to split words (e.g. a zero-width space inside "fuck")
+_ZERO_WIDTH = {"\u200b", "\u200c", "\u200d", "\u2060", "\ufeff", "\u00ad", "\u180e"}
+
+# Look-alike letters from other scripts (NFKC leaves these alone)
+_CONFUSABLES = {
+    # Cyrillic
+    "а": "a", "в": "b", "е": "e", "ё": "e", "к": "k", "м": "m", "н": "h", "о": "o", "р": "p", "с": "c",
+    "т": "t", "у": "y", "х": "x", "і": "i", "ї": "i", "ј": "j", "ѕ": "s", "ԁ": "d", "ԛ": "q", "ԝ": "w",
+    # Greek
+    "α": "a", "β": "b", "ε": "e", "η": "n", "ι": "i", "κ": "k", "ν": "v", "ο": "o", "ρ": "p", "τ": "t",
+    "υ": "u", "χ": "x", "ω": "w",
+    # Latin look-alikes
+    "ı": "i", "ł": "l", "ø": "o", "đ": "d", "ħ": "h", "ŧ": "t",
+}
+
+# Leetspeak. '!' and '|' are left alone so punctuation after a word doesn't glue onto it.
+_LEET = {"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b", "9": "g", "@": "a", "$": "s"}
+
+
+def _is_diacritic(c: str) -> bool:
+    # Only the generic combining-diacritics blocks; Indic vowel signs etc. are kept
+    cp = ord(c)
+    return 0x0300 <= cp <= 0x036F or 0x1AB0 <= cp <= 0x1AFF or 0x1DC0 <= cp <= 0x1DFF or 0x20D0 <= cp <= 0x20FF or 0xFE20 <= cp <= 0xFE2F
+
+
+# Non-ASCII characters are memoized up to this many distinct code points; a
+# flood of unique characters evicts old ones instead of growing memory
+FOLD_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=FOLD_CACHE_SIZE)
+def _fold_char(ch: str) -> str:
+    if ch in _ZERO_WIDTH:
+        return ""
+    folded = unicodedata.normalize("NFKC", ch).casefold()
+    folded = "".join(c for c in unicodedata.normalize("NFD", folded) if not _is_diacritic(c))
+    return "".join(_CONFUSABLES.get(c, _LEET.get(c, c)) for c in folded)
+
+
+@lru_cache(maxsize=FOLD_CACHE_SIZE)
+def _fold_char_strict(ch: str) -> str:
+    # Spelling-preserving: accents, digits and symbols stay as written
+    if ch in _ZERO_WIDTH:
+        return ""
+    return "".join(_CONFUSABLES.get(c, c) for c in unicodedata.normalize("NFKC", ch).casefold())
+
+
+# ASCII char -> folded string, fixed size; anything else goes through _fold_char's LRU
+_TABLE: Dict[str, str] = {chr(i): _fold_char(chr(i)) for i in range(128)}
+
+
+def canonicalize(text: str) -> Tuple[str, List[int], List[int]]:
+    """
+    One pass over text: NFKC + casefold, diacritic and zero-width stripping,
+    homoglyph and leetspeak mapping, and repeated-character collapse.
+
+    Returns (canonical, offsets, runs):
+      offsets[i] is the index in text where canonical[i]'s run starts, plus
+        a final entry len(text), so text[offsets[s]:offsets[e]] is the
+        original span of canonical[s:e];
+      runs[i] is how many folded characters canonical[i] stands for, so a
+        match can require 'kill' to keep its double 'l'.
+    """
+    table = _TABLE
+    chars: List[str] = []
+    offsets: List[int] = []
+    runs: List[int] = []
+    last = None
+    for i, ch in enumerate(text):
+        folded = table.get(ch)
+        if folded is None:
+            folded = _fold_char(ch)
+        for c in folded:
+            if c == last:
+                runs[-1] += 1
+            else:
+                chars.append(c)
+                offsets.append(i)
+                runs.append(1)
+                last = c
+    offsets.append(len(text))
+    return "".join(chars), offsets, runs
+
+
+def fold_exact(text: str) -> Tuple[str, List[int]]:
+    """
+    Case, width and homoglyph folding plus zero-width stripping only: no
+    diacritic stripping, leetspeak or repeat collapse, so 'salle', 'salé'
+    and 'coño' keep their spelling. For terms that must match as written.
+
+    Returns (folded, offsets) with offsets as in canonicalize, or None for
+    offsets when folded lines up with text character for character.
+    """
+    if text.isascii():
+        return text.lower(), None
+    chars: List[str] = []
+    offsets: List[int] = []
+    for i, ch in enumerate(text):
+        for c in _fold_char_strict(ch):
+            chars.append(c)
+            offsets.append(i)
+    offsets.append(len(text))
+    return "".join(chars), offsets
+
+
+def runs_cover(runs: Sequence[int], start: int, term_runs: Sequence[int]) -> bool:
+    """True if every run in runs[start:] is at least as long as the term's (f+u+c+k+ semantics)"""
+    for j, needed in enumerate(term_runs):
+        if runs[start + j] < needed:
+            return False
+    return True
@@ -0,0 +1,370 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+# Background video moderation. Uploads are queued in the VideoJob table and picked
+# up by VIDEO_JOB_WORKERS threads per process. This needs a long-lived host (the
+# Render/Docker deployment). On serverless (Vercel) threads die with the request,
+# so workers default to 0 there; a separate drainer must run
+#     python -m app.services.video_jobs
+# against the same DATABASE_URL, with VIDEO_JOB_DIR on storage both can see.
+# Without that, the video endpoint answers 503 instead of queueing jobs nobody runs.
+_SERVERLESS = bool(os.environ.get("VERCEL"))
+VIDEO_JOB_WORKERS = int(os.environ.get("VIDEO_JOB_WORKERS", "0" if _SERVERLESS else "2"))
+VIDEO_JOB_POLL_SECONDS = float(os.environ.get("VIDEO_JOB_POLL_SECONDS", "2"))
+# A running job whose heartbeat is older than this is re-queued (its process died)
+VIDEO_JOB_STALE_SECONDS = float(os.environ.get("VIDEO_JOB_STALE_SECONDS", "120"))
+VIDEO_JOB_MAX_ATTEMPTS = int(os.environ.get("VIDEO_JOB_MAX_ATTEMPTS", "3"))
+# Minimum gap between progress writes for one job (stage changes are always written)
+VIDEO_JOB_PROGRESS_SECONDS = float(os.environ.get("VIDEO_JOB_PROGRESS_SECONDS", "1"))
+# Queued jobs no worker has claimed after this long are failed rather than left pending,
+# but only while no worker is alive; behind a backlog or after a restart they keep waiting
+VIDEO_JOB_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("VIDEO_JOB_QUEUE_TIMEOUT_SECONDS", "900"))
+# Where uploads wait for their job; must outlive a restart, so not a per-request temp file.
+# Setting it explicitly declares it shared with the drainer process.
+VIDEO_JOB_DIR = os.environ.get("VIDEO_JOB_DIR", os.path.join(tempfile.gettempdir(), "safechat_video_jobs"))
+_SHARED_DIR = "VIDEO_JOB_DIR" in os.environ
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_stop = threading.Event()
+_wake = threading.Event()
+_threads: List[threading.Thread] = []
+_running = set()  # VideoJob.id values this process is working on
+_running_lock = threading.Lock()
+
+
+def accepting_jobs() -> bool:
+    """Whether a queued upload can reach a worker: ours, or a drainer sharing VIDEO_JOB_DIR"""
+    return VIDEO_JOB_WORKERS > 0 or _SHARED_DIR
+
+
+def upload_path(suffix: str = ".mp4") -> str:
+    """A fresh path in VIDEO_JOB_DIR for an upload that will be queued"""
+    os.makedirs(VIDEO_JOB_DIR, exist_ok=True)
+    return os.path.join(VIDEO_JOB_DIR, f"{uuid.uuid4().hex}{suffix}")
+
+
+def enqueue(file_path: str, filename: Optional[str], source: Optional[str], user_id: Optional[int], frame_interval: int = 2, sha256: Optional[str] = None):
+    """Queue an upload already saved at file_path (sha256: its digest, if known); the job owns the file from here on"""
+    from sqlmodel import Session
+    from app.db import engine
+    from app.models import VideoJob
+
+    job = VideoJob(
+        job_id=uuid.uuid4().hex,
+        file_path=file_path,
+        sha256=sha256,
+        filename=filename,
+        frame_interval=frame_interval,
+        source=source,
+        user_id=user_id,
+        stage="queued"
+    )
+    with Session(engine) as session:
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+    _wake.set()
+    return job
+
+
+def _workers_alive() -> bool:
+    """A worker thread runs in this process, or some process heartbeated a job recently"""
+    from sqlmodel import Session, select
+    from app.db import engine
+    from app.models import VideoJob
+
+    if any(thread.is_alive() for thread in _threads):
+        return True
+    cutoff = datetime.utcnow() - timedelta(seconds=VIDEO_JOB_STALE_SECONDS)
+    with Session(engine) as session:
+        recent = session.exec(
+            select(VideoJob.id).where(VideoJob.status == "running", VideoJob.heartbeat_at >= cutoff).limit(1)
+        ).first()
+    return recent is not None
+
+
+def get_job(job_id: str):
+    """
+    The job by public id. A job left queued past VIDEO_JOB_QUEUE_TIMEOUT_SECONDS
+    is failed first, but only when no worker can pick it up (none configured,
+    or none alive); otherwise it is just waiting its turn.
+    """
+    from sqlmodel import Session, select
+    from app.db import engine
+    from app.models import VideoJob
+
+    with Session(engine) as session:
+        job = session.exec(select(VideoJob).where(VideoJob.job_id == job_id)).first()
+    if (job is not None and job.status == "queued"
+            and job.created_at < datetime.utcnow() - timedelta(seconds=VIDEO_JOB_QUEUE_TIMEOUT_SECONDS)
+            and (not accepting_jobs() or not _workers_alive())):
+        if _update(job.id, only_if_status="queued", status="failed", stage="failed", finished_at=datetime.utcnow(),
+                   error="No video worker picked up this job (is a long-lived worker running?)"):
+            _remove_upload(job.file_path)
+        with Session(engine) as session:
+            job = session.get(VideoJob, job.id)
+    return job
+
+
+def to_dict(job) -> Dict:
+    def iso(value):
+        return value.isoformat() if value else None
+
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "stage": job.stage,
+        "frames_scanned": job.frames_scanned,
+        "attempts": job.attempts,
+        "filename": job.filename,
+        "created_at": iso(job.created_at),
+        "started_at": iso(job.started_at),
+        "finished_at": iso(job.finished_at),
+        "error": job.error,
+        "log_id": job.log_id,
+        "data": json.loads(job.result) if job.result else None
+    }
+
+
+def _update(job_pk: int, only_if_status: Optional[str] = None, **values) -> bool:
+    """UPDATE one VideoJob row; with only_if_status it is a compare-and-set (False if another worker won)"""
+    from sqlalchemy import update
+    from app.db import engine
+    from app.models import VideoJob
+
+    statement = update(VideoJob).where(VideoJob.id == job_pk)
+    if only_if_status is not None:
+        statement = statement.where(VideoJob.status == only_if_status)
+    with engine.begin() as conn:
+        return conn.execute(statement.values(**values)).rowcount == 1
+
+
+def _claim() -> Optional[int]:
+    """Take the oldest queued job for this process; safe with several processes polling the table"""
+    from sqlmodel import Session, select
+    from app.db import engine
+    from app.models import VideoJob
+
+    with Session(engine) as session:
+        candidates = session.exec(
+            select(VideoJob.id, VideoJob.attempts).where(VideoJob.status == "queued").order_by(VideoJob.id).limit(5)
+        ).all()
+    for job_pk, attempts in candidates:
+        now = datetime.utcnow()
+        if _update(job_pk, only_if_status="queued", status="running", stage="starting", worker_id=WORKER_ID,
+                   heartbeat_at=now, started_at=now, attempts=attempts + 1):
+            return job_pk
+    return None
+
+
+class _Progress:
+    """progress(stage, frames_scanned) callback for moderate_video, throttled to VIDEO_JOB_PROGRESS_SECONDS"""
+
+    def __init__(self, job_pk: int):
+        self.job_pk = job_pk
+        self.stage = None
+        self.written_at = 0.0
+
+    def __call__(self, stage: str, frames_scanned: int = 0):
+        now = time.monotonic()
+        if stage == self.stage and now - self.written_at < VIDEO_JOB_PROGRESS_SECONDS:
+            return
+        self.stage, self.written_at = stage, now
+        try:
+            _update(self.job_pk, stage=stage, frames_scanned=frames_scanned, heartbeat_at=datetime.utcnow())
+        except Exception as e:
+            print(f"Video job progress update failed: {e}")
+
+
+def _remove_upload(path: str):
+    try:
+        if path and os.path.exists(path):
+            os.remove(path)
+    except OSError as e:
+        print(f"Could not remove video upload {path}: {e}")
+
+
+def _process(job_pk: int):
+    from sqlmodel import Session
+    from app.db import engine
+    from app.models import ModerationLog, VideoJob
+    from app.services.video_moderator import moderate_video
+
+    with Session(engine) as session:
+        job = session.get(VideoJob, job_pk)
+        file_path, frame_interval, digest = job.file_path, job.frame_interval, job.sha256
+
+    if not os.path.exists(file_path):
+        # Saved on another machine's local disk: VIDEO_JOB_DIR isn't shared with this worker
+        result = {"error": f"Upload not found on worker {WORKER_ID}; VIDEO_JOB_DIR must be shared storage", "is_flagged": False}
+    else:
+        try:
+            result = moderate_video(file_path, frame_interval, progress=_Progress(job_pk), sha256=digest)
+        except Exception as e:
+            result = {"error": str(e), "is_flagged": False}
+
+    with Session(engine) as session:
+        job = session.get(VideoJob, job_pk)
+        if job.status != "running" or job.worker_id != WORKER_ID:
+            return  # Re-queued as stale and taken over elsewhere; that run reports the verdict
+        job.result = json.dumps(result)
+        job.frames_scanned = result.get("scanned_frames", job.frames_scanned)
+        job.finished_at = datetime.utcnow()
+        if "error" in result:
+            job.status, job.stage, job.error = "failed", "failed", result["error"]
+        else:
+            # The log and the job's final state commit together, so a crash can't log a video twice
+            log = ModerationLog(
+                content_type="video",
+                content_excerpt=f"Video: {job.filename}",
+                is_flagged=bool(result.get("is_flagged")),
+                details=json.dumps(result),
+                source=job.source
+            )
+            session.add(log)
+            session.flush()
+            job.status, job.stage, job.log_id = "done", "done", log.id
+        session.add(job)
+        session.commit()
+    _remove_upload(file_path)
+
+
+def _recover(startup: bool = False) -> Dict:
+    """
+    Re-queue running jobs whose worker stopped heartbeating (at startup also this
+    process's own leftovers, e.g. the same pid in a restarted container). Jobs
+    out of attempts are failed instead. Returns {"requeued", "failed"} counts.
+    """
+    from sqlmodel import Session, or_, select
+    from app.db import engine
+    from app.models import VideoJob
+
+    cutoff = datetime.utcnow() - timedelta(seconds=VIDEO_JOB_STALE_SECONDS)
+    stale = VideoJob.heartbeat_at < cutoff
+    if startup:
+        stale = or_(stale, VideoJob.worker_id == WORKER_ID)
+    with Session(engine) as session:
+        jobs = session.exec(select(VideoJob).where(VideoJob.status == "running", stale)).all()
+
+    requeued = failed = 0
+    for job in jobs:
+        if job.id in _running:
+            continue
+        if job.attempts >= VIDEO_JOB_MAX_ATTEMPTS:
+            if _update(job.id, only_if_status="running", status="failed", stage="failed",
+                       error=f"Gave up after {job.attempts} attempts", finished_at=datetime.utcnow()):
+                _remove_upload(job.file_path)
+                failed += 1
+        elif _update(job.id, only_if_status="running", status="queued", stage="queued", worker_id=None):
+            requeued += 1
+    if requeued or failed:
+        print(f"Video jobs: re-queued {requeued} interrupted job(s), failed {failed} out of attempts.")
+    if requeued:
+        _wake.set()
+    return {"requeued": requeued, "failed": failed}
+
+
+def _heartbeat():
+    with _running_lock:
+        running = list(_running)
+    for job_pk in running:
+        _update(job_pk, heartbeat_at=datetime.utcnow())
+
+
+def _supervise():
+    # Keeps this process's jobs alive in the table and rescues other processes' dead ones
+    interval = max(1.0, VIDEO_JOB_STALE_SECONDS / 4)
+    while not _stop.wait(interval):
+        try:
+            _heartbeat()
+            _recover()
+        except Exception as e:
+            print(f"Video job supervisor error: {e}")
+
+
+def _work():
+    while not _stop.is_set():
+        try:
+            job_pk = _claim()
+        except Exception as e:
+            print(f"Video job claim failed: {e}")
+            job_pk = None
+        if job_pk is None:
+            _wake.wait(VIDEO_JOB_POLL_SECONDS)
+            _wake.clear()
+            continue
+
+        with _running_lock:
+            _running.add(job_pk)
+        try:
+            _process(job_pk)
+        except Exception as e:
+            print(f"Video job {job_pk} failed: {e}")
+            try:
+                _update(job_pk, status="failed", stage="failed", error=str(e), finished_at=datetime.utcnow())
+            except Exception:
+                pass
+        finally:
+            with _running_lock:
+                _running.discard(job_pk)
+
+
+def start(workers: Optional[int] = None) -> int:
+    """Recover interrupted jobs and start the worker threads; returns the number of workers"""
+    workers = VIDEO_JOB_WORKERS if workers is None else workers
+    if workers <= 0 or _threads:
+        return len(_threads)
+    try:
+        recovered = _recover(startup=True)
+        print(f"Video job recovery: {recovered['requeued']} re-queued, {recovered['failed']} failed.")
+    except Exception as e:
+        print(f"Video job recovery failed: {e}")
+    _stop.clear()
+    for i in range(workers):
+        thread = threading.Thread(target=_work, name=f"video-job-{i}", daemon=True)
+        thread.start()
+        _threads.append(thread)
+    supervisor = threading.Thread(target=_supervise, name="video-job-supervisor", daemon=True)
+    supervisor.start()
+    _threads.append(supervisor)
+    return workers
+
+
+def stop(timeout: float = 5.0):
+    """Ask the workers to exit after their current job (unfinished jobs are recovered on the next start)"""
+    _stop.set()
+    _wake.set()
+    for thread in _threads:
+        thread.join(timeout)
+    _threads.clear()
+
+
+def main():
+    """Standalone drainer for deployments whose web process can't keep threads alive"""
+    import signal
+    from sqlmodel import SQLModel
+    from app.db import engine
+    import app.models  # Register models
+
+    SQLModel.metadata.create_all(engine)
+    workers = int(os.environ.get("VIDEO_JOB_DRAIN_WORKERS", str(max(VIDEO_JOB_WORKERS, 1))))
+    print(f"Video job drainer {WORKER_ID}: {start(workers)} workers, uploads in {VIDEO_JOB_DIR}")
+    signal.signal(signal.SIGTERM, lambda *_: _stop.set())
+    try:
+        while not _stop.wait(1.0):
+            pass
+    except KeyboardInterrupt:
+        pass
+    stop()
+
+
+if __name__ == "__main__":
+    main()
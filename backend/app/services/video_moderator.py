@@ -3,81 +3,269 @@ try:
 except Exception:
     cv2 = None
 import os
+import shutil
 import tempfile
-import base64
-from typing import Dict, List
-from app.services.image_moderator import moderate_image_base64
-from app.services.audio_moderator import moderate_audio_base64
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from app.services.image_moderator import IMAGE_BATCH_SIZE, IMAGE_DECODE_SIZE, IMAGE_MODEL_VERSION, _is_decisive, _load_nsfw_model, moderate_images
+from app.services import blocklist_cache, media_verdicts, text_moderator
+from app.services.audio_moderator import moderate_media_audio
 from PIL import Image
-import io
 
-def moderate_video(file_path: str, frame_interval: int = 2) -> Dict:
+# Stop sampling frames after a batch with a decisive NSFW hit (audio is still checked)
+VIDEO_EARLY_EXIT = os.environ.get("VIDEO_EARLY_EXIT", "true").lower() in ("1", "true", "yes")
+
+# Frame sampling: one frame per frame_interval seconds, stretched so long videos are
+# covered end to end within VIDEO_MAX_FRAMES, plus extra samples on scene changes
+VIDEO_MIN_FRAMES = int(os.environ.get("VIDEO_MIN_FRAMES", "8"))
+VIDEO_MAX_FRAMES = int(os.environ.get("VIDEO_MAX_FRAMES", "240"))
+VIDEO_SCENE_EXTRA_RATIO = float(os.environ.get("VIDEO_SCENE_EXTRA_RATIO", "0.25"))  # scene samples per regular sample
+VIDEO_SCENE_PROBE_SECONDS = float(os.environ.get("VIDEO_SCENE_PROBE_SECONDS", "0.5"))
+VIDEO_SCENE_THRESHOLD = float(os.environ.get("VIDEO_SCENE_THRESHOLD", "0.4"))  # Bhattacharyya distance
+
+# Threads running the visual and audio branches of a video side by side (two per video).
+# Separate from the request-level moderation pool so a video job never waits on itself.
+VIDEO_BRANCH_WORKERS = int(os.environ.get("VIDEO_BRANCH_WORKERS", "4"))
+_branch_pool = None
+
+def moderate_video(file_path: str, frame_interval: int = 2, progress=None, sha256: Optional[str] = None) -> Dict:
     """
     Moderate video by analyzing frames and audio.
     frame_interval: Analyze 1 frame every X seconds.
+    progress: optional progress(stage, frames_scanned) callback (e.g. a video job).
+    sha256: digest of the file if the caller already has it (saves a re-read).
+    The same file bytes reuse the stored verdict (MediaVerdict).
     """
     if not os.path.exists(file_path):
         return {"error": "File not found", "is_flagged": False}
 
-    flags = []
-    is_flagged = False
-    
-    try:
-        if cv2 is None:
-            return {"error": "Video moderation disabled (OpenCV not installed)", "is_flagged": False}
+    digest = sha256
+    if digest is None:
+        if progress:
+            progress("hashing", 0)
+        digest = media_verdicts.sha256_file(file_path)
+    # Transcripts go through text moderation, so its model and the blocklist are part of the key
+    model_version = (
+        f"{IMAGE_MODEL_VERSION}|audio:whisper-base|every{frame_interval}s|early_exit={VIDEO_EARLY_EXIT}"
+        f"|frames{VIDEO_MIN_FRAMES}-{VIDEO_MAX_FRAMES}|scene{VIDEO_SCENE_THRESHOLD}x{VIDEO_SCENE_EXTRA_RATIO}"
+        f"|text:{text_moderator.MODEL_VERSION}|blocklist:{blocklist_cache.fingerprint()}"
+    )
+    stored = media_verdicts.get(digest, model_version)
+    if stored is not None:
+        stored["sha256"] = digest
+        return stored
 
-        # 1. Analyze Frames
-        cap = cv2.VideoCapture(file_path)
-        if not cap.isOpened():
-             print(f"Error: Could not open video file {file_path}")
-             return {"error": "Could not open video file", "is_flagged": False}
-             
+    result = _moderate_video(file_path, frame_interval, progress)
+    result["sha256"] = digest  # Lets a reviewer's dismissal find the stored verdict again
+    if _is_complete(result):
+        media_verdicts.put(digest, "video", model_version, result)
+    return result
+
+def _is_complete(result: Dict) -> bool:
+    # Only store verdicts produced with every model available
+    if "error" in result:
+        return False
+    # Audio stopped by a decisive visual hit still yields a settled (flagged) verdict
+    if not result.get("audio_checked") and "audio" not in result.get("cancelled", []):
+        return False
+    if any(f.get("type") == "system_warning" for f in result.get("flags", [])):
+        return False
+    model = _load_nsfw_model()
+    return bool(model)
+
+def _frame_plan(fps: float, total_frames: int, frame_interval: float) -> Dict:
+    """Regular sampling step and frame budgets, scaled to the video's duration"""
+    duration = total_frames / fps if total_frames > 0 else 0.0
+    interval = float(frame_interval)
+    if duration:
+        regular = max(VIDEO_MIN_FRAMES, int(duration / interval) + 1)
+        if regular > VIDEO_MAX_FRAMES:
+            # Long video: spread the budget over the whole duration instead of stopping early
+            regular = VIDEO_MAX_FRAMES
+            interval = duration / VIDEO_MAX_FRAMES
+    else:
+        regular = VIDEO_MAX_FRAMES  # Unknown length (stream metadata missing)
+    return {
+        "duration": duration,
+        "interval": interval,
+        "step": max(1, int(round(fps * interval))),
+        "probe_step": max(1, int(round(fps * VIDEO_SCENE_PROBE_SECONDS))),
+        "regular": regular,
+        "scene": max(4, int(regular * VIDEO_SCENE_EXTRA_RATIO)),
+    }
+
+def _histogram(frame):
+    # Hue/saturation histogram of a thumbnail: cheap, and robust to small motion
+    small = cv2.resize(frame, (64, 36), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [16, 8], [0, 180, 0, 256])
+    return cv2.normalize(hist, hist)
+
+def _to_pil(frame) -> Image.Image:
+    # Shrink to what the image pipeline decodes uploads to, then BGR (OpenCV) -> RGB (PIL)
+    h, w = frame.shape[:2]
+    scale = IMAGE_DECODE_SIZE / max(w, h)
+    if scale < 1:
+        frame = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+def _sample_frames(cap, plan: Dict):
+    """
+    Yield (frame number, PIL frame, reason) in one sequential pass. grab()
+    advances the decoder without seeking; retrieve() converts only the frames
+    that are sampled or probed. Frames on the regular grid are sampled
+    ("interval"). Every probe_step frames a histogram is compared with the
+    previous probe, and a large jump adds a sample ("scene_change") from a
+    separate budget.
+    """
+    regular_left, scene_left = plan["regular"], plan["scene"]
+    step, probe_step = plan["step"], plan["probe_step"]
+    min_gap = max(1, step // 4)  # don't double-sample right next to a grid frame
+    last_hist = None
+    last_sample = -step
+    frame_no = -1
+    while regular_left > 0 or scene_left > 0:
+        if not cap.grab():
+            break
+        frame_no += 1
+        due = frame_no % step == 0 and regular_left > 0
+        probe = frame_no % probe_step == 0
+        if not due and not probe:
+            continue
+        ok, frame = cap.retrieve()
+        if not ok:
+            continue
+
+        hist = _histogram(frame)
+        changed = last_hist is not None and cv2.compareHist(last_hist, hist, cv2.HISTCMP_BHATTACHARYYA) > VIDEO_SCENE_THRESHOLD
+        last_hist = hist
+        if due:
+            regular_left -= 1
+            last_sample = frame_no
+            yield frame_no, _to_pil(frame), "interval"
+        elif changed and scene_left > 0 and frame_no - last_sample >= min_gap:
+            scene_left -= 1
+            last_sample = frame_no
+            yield frame_no, _to_pil(frame), "scene_change"
+
+def _get_branch_pool() -> ThreadPoolExecutor:
+    global _branch_pool
+    if _branch_pool is None:
+        _branch_pool = ThreadPoolExecutor(max_workers=VIDEO_BRANCH_WORKERS, thread_name_prefix="video-branch")
+    return _branch_pool
+
+def _scan_frames(file_path: str, frame_interval: float, cancel=None, progress=None) -> Dict:
+    """
+    Visual branch: sampled frames through the batched image pipeline. With a
+    cancel token (threading.Event) the scan stops once it is set, and sets it
+    itself after a decisive hit when VIDEO_EARLY_EXIT is on.
+    """
+    cap = cv2.VideoCapture(file_path)
+    if not cap.isOpened():
+        print(f"Error: Could not open video file {file_path}")
+        return {"error": "Could not open video file", "is_flagged": False}
+
+    try:
         fps = cap.get(cv2.CAP_PROP_FPS)
         if fps <= 0: fps = 24 # Fallback
-        
-        frame_step = int(fps * frame_interval)
-        
-        current_frame = 0
+        plan = _frame_plan(fps, int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0), frame_interval)
+
+        flags = []
+        sampled = {"interval": 0, "scene_change": 0}
         scanned_frames = 0
-        
+        cancelled = False
+        pending = []  # (frame number, frame, reason) waiting for one batched model pass
+        frames = _sample_frames(cap, plan)
         while True:
-            # Jump to next frame
-            cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame)
-            ret, frame = cap.read()
-            if not ret:
+            if cancel is not None and cancel.is_set():
+                cancelled = True
+                break
+            item = next(frames, None)
+            if item is not None:
+                pending.append(item)
+                sampled[item[2]] += 1
+                if len(pending) < IMAGE_BATCH_SIZE:
+                    continue
+            if not pending:
                 break
-                
-            # Convert BGR (OpenCV) to RGB (PIL)
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            pil_img = Image.fromarray(rgb_frame)
-            
-            # Convert to base64 for existing image moderator
-            buff = io.BytesIO()
-            pil_img.save(buff, format="JPEG")
-            b64_str = base64.b64encode(buff.getvalue()).decode("utf-8")
-            
-            # Check frame
-            res = moderate_image_base64(b64_str)
-            if res.get("is_flagged"):
-                timestamp = current_frame / fps
-                flags.append({
-                    "type": "visual_content",
-                    "timestamp": f"{int(timestamp//60)}:{int(timestamp%60):02d}",
-                    "details": res.get("flags", [])
-                })
-                is_flagged = True
-                
-            current_frame += frame_step
-            scanned_frames += 1
-            
-            # Safety break for huge videos in demo
-            if scanned_frames > 50: 
+
+            results = moderate_images([img for _, img, _ in pending], stop_on_first_hit=VIDEO_EARLY_EXIT)
+            for (frame_no, _, reason), res in zip(pending, results):
+                if res.get("skipped"):
+                    continue
+                scanned_frames += 1
+                if res.get("is_flagged"):
+                    timestamp = frame_no / fps
+                    flags.append({
+                        "type": "visual_content",
+                        "timestamp": f"{int(timestamp//60)}:{int(timestamp%60):02d}",
+                        "sample": reason,
+                        "details": res.get("flags", []),
+                        # Frame hashes, so a reviewer's confirm indexes the offending frames
+                        "dhash": res.get("details", {}).get("dhash"),
+                        "phash": res.get("details", {}).get("phash")
+                    })
+            pending = []
+            if progress:
+                progress("analyzing", scanned_frames)
+            if VIDEO_EARLY_EXIT and any(_is_decisive(r) for r in results):
+                if cancel is not None:
+                    cancel.set()  # Settled: stop the audio branch too
+                break  # Verdict is settled; the remaining frames can't change it
+            if item is None:
                 break
-                
+    finally:
         cap.release()
 
-        # 2. Analyze Audio (using Whisper via existing moderator)
-        import shutil
+    return {
+        "is_flagged": bool(flags),
+        "flags": flags,
+        "scanned_frames": scanned_frames,
+        "cancelled": cancelled,
+        "sampling": {
+            "duration_seconds": round(plan["duration"], 2),
+            "interval_seconds": round(plan["interval"], 3),
+            "interval_frames": sampled["interval"],
+            "scene_change_frames": sampled["scene_change"],
+        },
+    }
+
+def _scan_audio(file_path: str, cancel) -> Dict:
+    """Audio branch: the track streamed from ffmpeg as 16 kHz PCM into Whisper; skipped if there is none"""
+    audio_res = moderate_media_audio(file_path, cancel=cancel)
+    if audio_res.get("is_flagged") and VIDEO_EARLY_EXIT:
+        cancel.set()  # Settled: stop the frame scan too
+    return audio_res
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, round((time.perf_counter() - start) * 1000, 1)
+
+def _moderate_video(file_path: str, frame_interval: int, progress=None) -> Dict:
+    """
+    Frames and audio are analyzed concurrently on the branch pool. They share
+    a cancel token: a decisive frame hit stops transcription and a flagged
+    transcript stops the frame scan, so a flagged video gets its verdict in
+    about the time of the faster branch.
+    """
+    flags = []
+    audio_checked = False
+    cancelled = []
+    timings = {}
+    started = time.perf_counter()
+
+    try:
+        if cv2 is None:
+            return {"error": "Video moderation disabled (OpenCV not installed)", "is_flagged": False}
+
+        if progress:
+            progress("analyzing", 0)
+        cancel = threading.Event()
+        pool = _get_branch_pool()
+        audio_future = None
         if not shutil.which("ffmpeg"):
             print("Warning: ffmpeg not found. Skipping audio moderation.")
             flags.append({
@@ -86,31 +274,46 @@ def moderate_video(file_path: str, frame_interval: int = 2) -> Dict:
                 "details": [{"label": "Audio analysis skipped: ffmpeg not installed on server"}]
             })
         else:
+            audio_future = pool.submit(_timed, _scan_audio, file_path, cancel)
+
+        # 1. Analyze Frames
+        visual, timings["visual_ms"] = pool.submit(_timed, _scan_frames, file_path, frame_interval, cancel, progress).result()
+        if "error" in visual:
+            cancel.set()
+            return visual
+        flags.extend(visual["flags"])
+        if visual.get("cancelled"):
+            cancelled.append("visual")
+
+        # 2. Analyze Audio (using Whisper via existing moderator)
+        if audio_future is not None:
             try:
-                # Read file as bytes to pass to audio moderator
-                with open(file_path, "rb") as f:
-                    file_bytes = f.read()
-                    b64_audio = base64.b64encode(file_bytes).decode("utf-8")
-                    
-                audio_res = moderate_audio_base64(b64_audio)
+                audio_res, timings["audio_ms"] = audio_future.result()
+                if audio_res.get("cancelled"):
+                    cancelled.append("audio")
+                else:
+                    audio_checked = "error" not in audio_res
                 if audio_res.get("is_flagged"):
-                    is_flagged = True
                     flags.append({
                         "type": "audio_content",
                         "timestamp": "Full Audio",
                         "details": audio_res.get("moderation", {}).get("flags", [])
                     })
-                    
+
             except Exception as e:
                 print(f"Audio moderation failed: {e}")
 
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
         return {
-            "is_flagged": is_flagged,
+            "is_flagged": any(f.get("type") != "system_warning" for f in flags),
             "flags": flags,
-            "scanned_frames": scanned_frames
+            "scanned_frames": visual["scanned_frames"],
+            "sampling": visual["sampling"],
+            "audio_checked": audio_checked,
+            "cancelled": cancelled,
+            "timings": timings
         }
 
-            
     except Exception as e:
         import traceback
         traceback.print_exc()
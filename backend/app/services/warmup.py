@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from typing import Dict, List
+
+# Opt-in: comma separated subset of "text,image,audio", or "all". Empty = lazy loading only.
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "")
+
+_lock = threading.Lock()
+_status: Dict[str, Dict] = {}
+
+
+def _warm_text():
+    from app.services import text_moderator
+    model = text_moderator._load_model()
+    if not model:
+        raise RuntimeError("toxic-bert unavailable (transformers missing or load failed)")
+    model("warm up")
+
+
+def _warm_image():
+    from PIL import Image
+    from app.services import image_moderator
+    model = image_moderator._load_nsfw_model()
+    if not model:
+        raise RuntimeError("NSFW model unavailable (transformers missing or load failed)")
+    model(Image.new("RGB", (224, 224)))
+
+
+def _warm_audio():
+    import numpy as np
+    from app.services import audio_moderator
+    model = audio_moderator._load_whisper()
+    model.transcribe(np.zeros(16000, dtype=np.float32))  # 1s of silence at 16 kHz
+
+
+_WARMERS = {"text": _warm_text, "image": _warm_image, "audio": _warm_audio}
+
+
+def configured_models() -> List[str]:
+    names = [n.strip().lower() for n in MODEL_WARMUP.split(",") if n.strip()]
+    if "all" in names:
+        return list(_WARMERS)
+    return [n for n in names if n in _WARMERS]
+
+
+def _lazy_state(name: str) -> str:
+    """State of a model that is not part of the warm-up, read from its loader's global"""
+    try:
+        if name == "text":
+            from app.services import text_moderator
+            model = text_moderator._model
+        elif name == "image":
+            from app.services import image_moderator
+            model = image_moderator._nsfw_model
+        else:
+            from app.services import audio_moderator
+            model = audio_moderator._whisper
+    except Exception:
+        return "unavailable"
+    if model is None:
+        return "not_loaded"
+    return "ready" if model else "failed"
+
+
+def _warm(name: str):
+    with _lock:
+        _status[name] = {"state": "loading", "load_seconds": None, "error": None}
+    started = time.perf_counter()
+    try:
+        _WARMERS[name]()
+        state, error = "ready", None
+    except Exception as e:
+        state, error = "failed", str(e)
+        print(f"Model warm-up failed for {name}: {e}")
+    with _lock:
+        _status[name] = {"state": state, "load_seconds": round(time.perf_counter() - started, 3), "error": error}
+    print(f"Model warm-up: {name} {state} in {_status[name]['load_seconds']}s")
+
+
+def start_warmup():
+    """Preload configured models plus one dummy inference each, in a background thread"""
+    names = configured_models()
+    if not names:
+        return None
+    with _lock:
+        for name in names:
+            _status[name] = {"state": "pending", "load_seconds": None, "error": None}
+
+    # One at a time so peak memory stays at one model load
+    def run():
+        for name in names:
+            _warm(name)
+
+    thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def readiness() -> Dict:
+    """Per-model state; ready only once every configured model is loaded ("ready")"""
+    configured = configured_models()
+    models = {}
+    with _lock:
+        for name in _WARMERS:
+            if name in _status:
+                models[name] = dict(_status[name])
+            else:
+                models[name] = {"state": _lazy_state(name), "load_seconds": None, "error": None}
+    # Pending, loading, failed, or never started (not_loaded/unavailable) all keep the instance out
+    not_ready = [n for n in configured if models[n]["state"] != "ready"]
+    failed = [n for n in configured if models[n]["state"] in ("failed", "unavailable")]
+    return {"ready": not not_ready, "warmup": configured, "not_ready": not_ready, "failed": failed, "models": models}
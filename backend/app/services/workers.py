@@ -0,0 +1,43 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads for CPU/network-bound moderation (translation, BERT, NSFW model)
+MODERATION_WORKERS = int(os.environ.get("MODERATION_WORKERS", "4"))
+# Max moderation jobs in flight (running + queued) per process; callers wait beyond this
+MODERATION_MAX_PENDING = int(os.environ.get("MODERATION_MAX_PENDING", "64"))
+# Threads for synchronous SQLModel sessions used from async handlers
+DB_WORKERS = int(os.environ.get("DB_WORKERS", "4"))
+
+_moderation_pool = ThreadPoolExecutor(max_workers=MODERATION_WORKERS, thread_name_prefix="moderation")
+_db_pool = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+_moderation_slots = None  # asyncio.Semaphore, created on first use inside the running loop
+
+
+async def run_moderation(fn, *args, **kwargs):
+    """Run a blocking moderation call off the event loop, bounded by MODERATION_MAX_PENDING"""
+    global _moderation_slots
+    if _moderation_slots is None:
+        _moderation_slots = asyncio.Semaphore(MODERATION_MAX_PENDING)
+    async with _moderation_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_moderation_pool, functools.partial(fn, *args, **kwargs))
+
+
+async def run_db(fn, *args, **kwargs):
+    """Run a blocking DB function off the event loop and wait for its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_pool, functools.partial(fn, *args, **kwargs))
+
+
+def submit_db(fn, *args, **kwargs):
+    """Fire-and-forget DB work (e.g. audit logs); failures are printed, not raised"""
+    future = _db_pool.submit(fn, *args, **kwargs)
+
+    def _report(f):
+        if f.exception() is not None:
+            print(f"Background DB task {getattr(fn, '__name__', fn)} failed: {f.exception()}")
+
+    future.add_done_callback(_report)
+    return future
@@ -0,0 +1,357 @@
+"""
+Text moderation benchmark: replays a labeled corpus (benchmark_corpus.jsonl by default)
+through each moderation target and reports per-message latency (p50/p95/p99),
+throughput and precision/recall per label, overall and per language/tag slice.
+
+    python benchmark_moderation.py --output results.json
+    python benchmark_moderation.py --backend pytorch,onnx --stages keywords,linear,model
+    python benchmark_moderation.py --baseline results.json   # exit 1 on regression
+
+Exits 1 whenever cascade or batch recall falls below the model alone (when the
+model is available), i.e. when an early exit lets toxic text through.
+
+Targets:
+  keywords  compiled blocklist only (original text)
+  linear    logistic pre-filter alone, flagged at score >= 0.5
+  model     the transformer alone (skipped if it can't be loaded)
+  cascade   moderate_text, one message at a time, verdict cache bypassed
+  batch     moderate_texts over the whole corpus; latency is amortized per message
+
+Corpus lines are {"text", "label": "toxic"|"clean", "lang", "tags": [...]}.
+Backend and cascade stages are read at import time, so each --backend value
+runs in its own subprocess.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_corpus.jsonl")
+ALL_TARGETS = ("keywords", "linear", "model", "cascade", "batch")
+LABELS = ("toxic", "clean")
+LINEAR_FLAG_AT = 0.5
+
+
+def load_corpus(path: str):
+    samples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                sample = json.loads(line)
+                sample.setdefault("lang", "und")
+                sample.setdefault("tags", [])
+                samples.append(sample)
+    return samples
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def latency_summary(latencies_ms):
+    values = sorted(latencies_ms)
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "mean": round(sum(values) / len(values), 3) if values else 0.0,
+        "max": round(values[-1], 3) if values else 0.0,
+    }
+
+
+def label_scores(pairs):
+    """Precision/recall/F1 per label from (expected, predicted) pairs"""
+    scores = {}
+    for label in LABELS:
+        tp = sum(1 for e, p in pairs if e == label and p == label)
+        fp = sum(1 for e, p in pairs if e != label and p == label)
+        fn = sum(1 for e, p in pairs if e == label and p != label)
+        precision = tp / (tp + fp) if tp + fp else None
+        recall = tp / (tp + fn) if tp + fn else None
+        f1 = 2 * precision * recall / (precision + recall) if precision and recall else None
+        scores[label] = {
+            "precision": round(precision, 4) if precision is not None else None,
+            "recall": round(recall, 4) if recall is not None else None,
+            "f1": round(f1, 4) if f1 is not None else None,
+            "support": tp + fn,
+        }
+    correct = sum(1 for e, p in pairs if e == p)
+    scores["accuracy"] = round(correct / len(pairs), 4) if pairs else None
+    return scores
+
+
+def accuracy_report(samples, predictions):
+    pairs = [(s["label"], "toxic" if flagged else "clean") for s, flagged in zip(samples, predictions)]
+    slices = {}
+    for s, pair in zip(samples, pairs):
+        for key in [f"lang:{s['lang']}"] + [f"tag:{t}" for t in s["tags"]]:
+            slices.setdefault(key, []).append(pair)
+    return {
+        "overall": label_scores(pairs),
+        "slices": {key: label_scores(slice_pairs) for key, slice_pairs in sorted(slices.items())},
+        "misclassified": [
+            {"text": s["text"][:80], "expected": e, "predicted": p, "lang": s["lang"]}
+            for s, (e, p) in zip(samples, pairs) if e != p
+        ],
+    }
+
+
+def _cascade_delta(before, after):
+    """Per-stage counts accumulated between two cascade stats snapshots"""
+    prior = {s["stage"]: s for s in before["stages"]}
+    items = after["items"] - before["items"]
+    stages = []
+    for s in after["stages"]:
+        p = prior.get(s["stage"], {})
+        allow = s["allow"] - p.get("allow", 0)
+        block = s["block"] - p.get("block", 0)
+        stages.append({
+            "stage": s["stage"],
+            "runs": s["runs"] - p.get("runs", 0),
+            "allow": allow,
+            "block": block,
+            "exit_share": round((allow + block) / items, 4) if items else 0.0,
+        })
+    return {"items": items, "stages": stages}
+
+
+def build_targets(tm):
+    """name -> callable(texts) -> (flagged per text, per-message latencies ms)"""
+    from app.services.linear_classifier import toxicity_score
+
+    matcher = tm.build_matcher()
+
+    def per_message(predict):
+        def run(texts):
+            flagged, latencies = [], []
+            for text in texts:
+                started = time.perf_counter()
+                flagged.append(predict(text))
+                latencies.append((time.perf_counter() - started) * 1000)
+            return flagged, latencies
+        return run
+
+    def model_predict(text):
+        model = tm._load_model()
+        return bool(tm._model_flags(tm._classify(model, text)))
+
+    def cascade_predict(text):
+        # Explicit (empty) dynamic terms: static lists only, no DB, no verdict cache
+        return bool(tm.moderate_text(text, additional_keywords=[]).get("is_flagged"))
+
+    def batch(texts):
+        started = time.perf_counter()
+        results = tm.moderate_texts(texts, additional_keywords=[])
+        per_item = (time.perf_counter() - started) * 1000 / max(len(texts), 1)
+        return [bool(r.get("is_flagged")) for r in results], [per_item] * len(texts)
+
+    return {
+        "keywords": per_message(lambda text: bool(matcher.match(text))),
+        "linear": per_message(lambda text: toxicity_score(text) >= LINEAR_FLAG_AT),
+        "model": per_message(model_predict),
+        "cascade": per_message(cascade_predict),
+        "batch": batch,
+    }
+
+
+def run_benchmark(samples, targets, repeat: int, cold: bool):
+    """Benchmark the current process's configuration (backend/stages from the environment)"""
+    from app.services import text_moderator as tm
+
+    texts = [s["text"] for s in samples]
+    available = build_targets(tm)
+    results = {}
+    for name in targets:
+        if name == "model" and not tm._load_model():
+            results[name] = {"skipped": "model unavailable"}
+            print(f"  {name}: skipped (model unavailable)", file=sys.stderr)
+            continue
+
+        run = available[name]
+        run(texts)  # warm-up pass: model load, translator, caches
+        cascade_before = tm.get_cascade_stats()
+        latencies, flagged = [], None
+        started = time.perf_counter()
+        for _ in range(repeat):
+            if cold:
+                tm._translation_cache.clear()
+            flagged, pass_latencies = run(texts)
+            latencies.extend(pass_latencies)
+        elapsed = time.perf_counter() - started
+
+        report = {
+            "messages": len(latencies),
+            "latency_ms": latency_summary(latencies),
+            "msgs_per_s": round(len(latencies) / elapsed, 1) if elapsed else None,
+            "accuracy": accuracy_report(samples, flagged),
+        }
+        if name in ("cascade", "batch"):
+            report["cascade"] = _cascade_delta(cascade_before, tm.get_cascade_stats())
+        results[name] = report
+
+        overall = report["accuracy"]["overall"]["toxic"]
+        print(
+            f"  {name:<9} p50={report['latency_ms']['p50']:.3f}ms p95={report['latency_ms']['p95']:.3f}ms "
+            f"p99={report['latency_ms']['p99']:.3f}ms {report['msgs_per_s']} msg/s "
+            f"toxic P={overall['precision']} R={overall['recall']}",
+            file=sys.stderr,
+        )
+
+    return {
+        "config": {
+            "backend": tm.TEXT_MODEL_BACKEND,
+            "stages": tm.TEXT_CASCADE_STAGES,
+            "model_version": tm.MODEL_VERSION,
+            "microbatch": tm.MICROBATCH_ENABLED,
+            "repeat": repeat,
+            "cold_translation_cache": cold,
+        },
+        "targets": results,
+    }
+
+
+def _run_backend_subprocess(backend: str, args) -> dict:
+    """Each backend needs a fresh import of text_moderator, so run it as a child process"""
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        out_path = f.name
+    cmd = [
+        sys.executable, os.path.abspath(__file__),
+        "--corpus", args.corpus, "--targets", args.targets, "--repeat", str(args.repeat),
+        "--backend", backend, "--output", out_path,
+    ]
+    if args.stages:
+        cmd += ["--stages", args.stages]
+    if args.cold:
+        cmd.append("--cold")
+    try:
+        subprocess.run(cmd, check=True)
+        with open(out_path, encoding="utf-8") as f:
+            return json.load(f)["runs"][0]
+    finally:
+        os.remove(out_path)
+
+
+def compare(baseline: dict, current: dict, latency_tolerance: float, accuracy_tolerance: float):
+    """Regressions of current vs baseline for runs with the same backend and stages"""
+    def key(run):
+        return (run["config"]["backend"], tuple(run["config"]["stages"]))
+
+    previous = {key(run): run for run in baseline.get("runs", [])}
+    regressions = []
+    for run in current["runs"]:
+        base = previous.get(key(run))
+        if base is None:
+            continue
+        for name, report in run["targets"].items():
+            old = base["targets"].get(name)
+            if not old or "skipped" in old or "skipped" in report:
+                continue
+            where = f"{run['config']['backend']}/{name}"
+            p95, old_p95 = report["latency_ms"]["p95"], old["latency_ms"]["p95"]
+            if old_p95 and p95 > old_p95 * (1 + latency_tolerance):
+                regressions.append(f"{where}: p95 {old_p95:.3f}ms -> {p95:.3f}ms")
+            for label in LABELS:
+                for metric in ("precision", "recall"):
+                    new_v = report["accuracy"]["overall"][label][metric]
+                    old_v = old["accuracy"]["overall"][label][metric]
+                    if new_v is not None and old_v is not None and new_v < old_v - accuracy_tolerance:
+                        regressions.append(f"{where}: {label} {metric} {old_v} -> {new_v}")
+    return regressions
+
+
+def cascade_recall_check(current: dict, tolerance: float):
+    """The cascade's early exits must not cost recall: cascade/batch vs model-only, per run"""
+    failures = []
+    for run in current["runs"]:
+        model = run["targets"].get("model")
+        if not model or "skipped" in model:
+            continue
+        model_recall = model["accuracy"]["overall"]["toxic"]["recall"] or 0.0
+        for name in ("cascade", "batch"):
+            report = run["targets"].get(name)
+            if not report or "skipped" in report:
+                continue
+            recall = report["accuracy"]["overall"]["toxic"]["recall"] or 0.0
+            if recall < model_recall - tolerance:
+                failures.append(f"{run['config']['backend']}/{name}: toxic recall {recall} < model-only {model_recall}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark text moderation latency and accuracy")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--targets", default=",".join(ALL_TARGETS), help=f"comma-separated subset of {','.join(ALL_TARGETS)}")
+    parser.add_argument("--backend", default=None, help="pytorch, onnx, or a comma-separated list to compare")
+    parser.add_argument("--stages", default=None, help="TEXT_CASCADE_STAGES override, e.g. keywords,linear,model")
+    parser.add_argument("--repeat", type=int, default=3, help="timed passes over the corpus per target")
+    parser.add_argument("--cold", action="store_true", help="clear the translation cache before each pass")
+    parser.add_argument("--output", default=None, help="write JSON results here (default: stdout)")
+    parser.add_argument("--baseline", default=None, help="previous results JSON; exit 1 on regression")
+    parser.add_argument("--latency-tolerance", type=float, default=0.2, help="allowed relative p95 increase")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.02, help="allowed absolute precision/recall drop")
+    args = parser.parse_args()
+
+    targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+    unknown = set(targets) - set(ALL_TARGETS)
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(sorted(unknown))}")
+    samples = load_corpus(args.corpus)
+    backends = [b.strip() for b in (args.backend or "").split(",") if b.strip()]
+
+    if len(backends) > 1:
+        runs = [_run_backend_subprocess(backend, args) for backend in backends]
+    else:
+        # Must be set before text_moderator is imported
+        if backends:
+            os.environ["TEXT_MODEL_BACKEND"] = backends[0]
+        if args.stages:
+            os.environ["TEXT_CASCADE_STAGES"] = args.stages
+        print(f"Benchmarking {len(samples)} samples x {args.repeat} passes "
+              f"(backend={os.environ.get('TEXT_MODEL_BACKEND', 'default')})", file=sys.stderr)
+        runs = [run_benchmark(samples, targets, args.repeat, args.cold)]
+
+    results = {
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "corpus": {"path": args.corpus, "samples": len(samples)},
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        json.dump(results, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+
+    recall_failures = cascade_recall_check(results, args.accuracy_tolerance)
+    if recall_failures:
+        print("CASCADE LOSES RECALL:", file=sys.stderr)
+        for line in recall_failures:
+            print(f"  {line}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(json.load(f), results, args.latency_tolerance, args.accuracy_tolerance)
+        if regressions:
+            print("REGRESSIONS:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
+        print("No regressions against baseline", file=sys.stderr)
+    if recall_failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
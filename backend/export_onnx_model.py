@@ -0,0 +1,60 @@
+"""
+Export unitary/toxic-bert to ONNX and quantize it to int8 for the "onnx" text backend.
+
+    pip install torch transformers onnx onnxruntime
+    python export_onnx_model.py [output_dir]
+
+Then run with TEXT_MODEL_BACKEND=onnx (and TEXT_ONNX_DIR=output_dir if not the default),
+and check verify_onnx_parity.py before switching production over.
+"""
+import os
+import sys
+
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+from onnxruntime.quantization import QuantType, quantize_dynamic
+
+from app.services.onnx_classifier import FP32_FILE, QUANTIZED_FILE
+from app.services.text_moderator import TEXT_MODEL_NAME, TEXT_ONNX_DIR
+
+
+def export(output_dir: str):
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Loading {TEXT_MODEL_NAME}...")
+    tokenizer = AutoTokenizer.from_pretrained(TEXT_MODEL_NAME)
+    model = AutoModelForSequenceClassification.from_pretrained(TEXT_MODEL_NAME)
+    model.eval()
+
+    sample = tokenizer(["export sample", "a second, longer export sample"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    print(f"Exporting to {fp32_path}...")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+
+    quantized_path = os.path.join(output_dir, QUANTIZED_FILE)
+    print(f"Quantizing to {quantized_path}...")
+    quantize_dynamic(fp32_path, quantized_path, weight_type=QuantType.QInt8)
+
+    # Tokenizer + config (labels, problem_type) are loaded from the same directory
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+
+    for path in (fp32_path, quantized_path):
+        print(f"  {os.path.basename(path)}: {os.path.getsize(path) / 1e6:.1f} MB")
+    print("Done.")
+
+
+if __name__ == "__main__":
+    export(sys.argv[1] if len(sys.argv) > 1 else TEXT_ONNX_DIR)
@@ -0,0 +1,134 @@
+"""
+Fit the linear pre-filter (app/services/linear_classifier.py) and calibrate its
+cascade exits on a labeled corpus (benchmark_corpus.jsonl by default).
+
+    python fit_linear_classifier.py [--corpus path] [--output linear_weights.json]
+
+Only texts the keyword stage lets through are used, since those are what the
+linear stage sees. Thresholds come from out-of-fold scores (each text scored by
+a model that never saw it):
+  allow_below  just under the lowest toxic score, scaled by --allow-margin, so no
+               corpus toxic text would skip the model
+  block_above  just over the highest clean score, and only if some toxic text
+               scores above it; otherwise >1 (disabled)
+The output holds the weights and both thresholds. Point TEXT_LINEAR_WEIGHTS at
+it (linear_weights.json next to this script is picked up by default) and the
+cascade runs the linear stage with those exits. Check the result with
+benchmark_moderation.py, which fails if cascade recall drops below the model's.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+from datetime import datetime
+
+from benchmark_moderation import DEFAULT_CORPUS, load_corpus
+from app.services import linear_classifier
+from app.services.text_moderator import build_matcher
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "linear_weights.json")
+FEATURES = tuple(linear_classifier.features(""))
+
+
+def _sigmoid(z: float) -> float:
+    if z < -60:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-z))
+
+
+def fit(rows, epochs: int, lr: float, l2: float):
+    """Class-balanced logistic regression by batch gradient descent; rows are (features, y)"""
+    positives = sum(y for _, y in rows) or 1
+    negatives = (len(rows) - positives) or 1
+    bias, weights = 0.0, dict.fromkeys(FEATURES, 0.0)
+    for _ in range(epochs):
+        grad_b, grad_w = 0.0, dict.fromkeys(FEATURES, 0.0)
+        total = 0.0
+        for x, y in rows:
+            scale = 0.5 / (positives if y else negatives)
+            error = (_sigmoid(bias + sum(weights[f] * x[f] for f in FEATURES)) - y) * scale
+            grad_b += error
+            for f in FEATURES:
+                grad_w[f] += error * x[f]
+            total += scale
+        bias -= lr * grad_b / total
+        for f in FEATURES:
+            weights[f] -= lr * (grad_w[f] / total + l2 * weights[f])
+    return bias, weights
+
+
+def score(bias, weights, x) -> float:
+    return _sigmoid(bias + sum(weights[f] * x[f] for f in FEATURES))
+
+
+def out_of_fold_scores(rows, folds: int, **fit_args):
+    scores = [None] * len(rows)
+    for k in range(folds):
+        train = [row for i, row in enumerate(rows) if i % folds != k]
+        bias, weights = fit(train, **fit_args)
+        for i, (x, _) in enumerate(rows):
+            if i % folds == k:
+                scores[i] = score(bias, weights, x)
+    return scores
+
+
+def calibrate(scores, labels, allow_margin: float):
+    toxic = [s for s, y in zip(scores, labels) if y]
+    clean = [s for s, y in zip(scores, labels) if not y]
+    allow_below = min(toxic) * allow_margin if toxic else 0.0
+    block_above = 1.01
+    if clean and toxic and max(toxic) > max(clean):
+        block_above = min(1.0, max(clean) + (max(toxic) - max(clean)) / 2)
+    return round(allow_below, 6), round(block_above, 6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--epochs", type=int, default=2000)
+    parser.add_argument("--lr", type=float, default=0.5)
+    parser.add_argument("--l2", type=float, default=0.01)
+    parser.add_argument("--allow-margin", type=float, default=0.9,
+                        help="allow_below = lowest out-of-fold toxic score times this")
+    args = parser.parse_args()
+
+    matcher = build_matcher()
+    samples = [s for s in load_corpus(args.corpus) if not matcher.match(s["text"])]
+    labels = [1 if s["label"] == "toxic" else 0 for s in samples]
+    if not any(labels) or all(labels):
+        print("Need both toxic and clean texts past the keyword stage to calibrate")
+        return 1
+    rows = [(linear_classifier.features(s["text"]), y) for s, y in zip(samples, labels)]
+    fit_args = {"epochs": args.epochs, "lr": args.lr, "l2": args.l2}
+
+    oof = out_of_fold_scores(rows, max(2, min(args.folds, len(rows))), **fit_args)
+    allow_below, block_above = calibrate(oof, labels, args.allow_margin)
+    bias, weights = fit(rows, **fit_args)
+
+    skipped = sum(1 for s, y in zip(oof, labels) if not y and s < allow_below)
+    blocked = sum(1 for s, y in zip(oof, labels) if y and s >= block_above)
+    print(f"{len(rows)} texts past the keyword stage ({sum(labels)} toxic)")
+    print(f"allow_below={allow_below}: {skipped}/{len(labels) - sum(labels)} clean texts would skip the model")
+    print(f"block_above={block_above}: {blocked}/{sum(labels)} toxic texts would be flagged without it")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "bias": round(bias, 6),
+            "weights": {name: round(w, 6) for name, w in weights.items()},
+            "lexicon": sorted(linear_classifier._lexicon),
+            "allow_below": allow_below,
+            "block_above": block_above,
+            "corpus": os.path.basename(args.corpus),
+            "samples": len(rows),
+            "fitted_at": datetime.utcnow().isoformat(timespec="seconds"),
+        }, f, indent=2)
+        f.write("\n")
+    print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
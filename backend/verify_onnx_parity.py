@@ -0,0 +1,74 @@
+"""
+Parity check: int8 ONNX text backend vs the PyTorch toxic-bert pipeline on a fixed corpus.
+Run after export_onnx_model.py. Exits non-zero if any verdict flips or a score drifts too far.
+"""
+import sys
+import time
+
+from app.services.text_moderator import TOXIC_LABELS, TOXIC_THRESHOLD, load_text_classifier
+
+# Max allowed absolute difference per label score (int8 weights are not bit-exact)
+MAX_SCORE_DIFF = 0.05
+
+CORPUS = [
+    "hello, how are you doing today?",
+    "thanks for the help yesterday, see you at the meeting",
+    "the weather is lovely this weekend",
+    "can you send me the notes from class",
+    "you are a complete idiot and everyone hates you",
+    "shut up, nobody wants to hear your stupid opinion",
+    "I will find you and hurt you",
+    "go back to where you came from, you people are disgusting",
+    "what a pathetic loser, just quit already",
+    "this is the worst movie I have ever seen",
+    "I disagree with your point but I respect it",
+    "get lost, you worthless piece of trash",
+    "congratulations on the new job!",
+    "you're so ugly it hurts to look at you",
+    "let's grab lunch tomorrow at noon",
+    "I hope you die in a fire",
+]
+
+
+def _scores(outputs):
+    return [{o["label"]: float(o["score"]) for o in row} for row in outputs]
+
+
+def _flagged(row):
+    return any(label.lower() in TOXIC_LABELS and score >= TOXIC_THRESHOLD for label, score in row.items())
+
+
+def verify():
+    print("Loading PyTorch pipeline...")
+    reference = load_text_classifier("pytorch")
+    print("Loading ONNX backend...")
+    candidate = load_text_classifier("onnx")
+    print(f"ONNX model: {candidate.model_path}")
+
+    t0 = time.perf_counter()
+    ref = _scores(reference(CORPUS, batch_size=8, truncation=True))
+    ref_time = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    onnx = _scores(candidate(CORPUS, batch_size=8, truncation=True))
+    onnx_time = time.perf_counter() - t0
+
+    failures = 0
+    worst = 0.0
+    for text, r, o in zip(CORPUS, ref, onnx):
+        diff = max(abs(r[label] - o.get(label, 0.0)) for label in r)
+        worst = max(worst, diff)
+        ok = diff <= MAX_SCORE_DIFF and _flagged(r) == _flagged(o)
+        if not ok:
+            failures += 1
+        print(f"[{'OK' if ok else 'FAIL'}] diff={diff:.4f} flagged={_flagged(r)}/{_flagged(o)} :: {text}")
+
+    print(f"\nWorst score diff: {worst:.4f} (limit {MAX_SCORE_DIFF})")
+    print(f"PyTorch: {ref_time * 1000:.1f} ms, ONNX: {onnx_time * 1000:.1f} ms for {len(CORPUS)} texts")
+    if failures:
+        print(f"PARITY FAILED for {failures}/{len(CORPUS)} texts")
+        sys.exit(1)
+    print("PARITY OK")
+
+
+if __name__ == "__main__":
+    verify()
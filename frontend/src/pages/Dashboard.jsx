@@ -133,7 +133,11 @@ const Dashboard = () => {
         }
       } else {
         console.error("Upload server error");
-        // Don't alert here to avoid disturbing flow, just let local preview stay or handle error
+        // Rejected files (wrong type, too large) need telling; other errors keep the flow quiet
+        if (res.status === 413 || res.status === 415) {
+          const errData = await res.json().catch(() => ({}));
+          alert(errData.detail || "This file can't be uploaded");
+        }
       }
     } catch (error) {
       console.error("Upload failed", error);
@@ -10,6 +10,7 @@ const VideoModeration = () => {
     const [previewUrl, setPreviewUrl] = useState('');
     const [loading, setLoading] = useState(false);
     const [result, setResult] = useState(null);
+    const [progress, setProgress] = useState(null);
     const fileInputRef = useRef(null);
     const { token } = useAuth();
 
@@ -45,16 +46,27 @@ const VideoModeration = () => {
                 throw new Error(errData.detail || 'Analysis failed');
             }
 
-            const data = await res.json();
-            if (data.data?.error) {
-                throw new Error(data.data.error);
+            // The upload is queued as a job; poll it until the verdict is ready
+            const { job_id } = await res.json();
+            let job;
+            do {
+                await new Promise((resolve) => setTimeout(resolve, 1500));
+                const poll = await fetch(getApiUrl(`/api/moderate/video/${job_id}`), { headers });
+                if (!poll.ok) throw new Error('Lost track of the analysis job');
+                job = await poll.json();
+                setProgress(job);
+            } while (job.status === 'queued' || job.status === 'running');
+
+            if (job.status === 'failed' || job.data?.error) {
+                throw new Error(job.error || job.data?.error || 'Analysis failed');
             }
-            setResult(data.data);
+            setResult(job.data);
         } catch (err) {
             console.error("Full error object:", err);
             alert(`Error analyzing video: ${err.message}`);
         } finally {
             setLoading(false);
+            setProgress(null);
         }
     };
 
@@ -112,7 +124,11 @@ const VideoModeration = () => {
                             {loading ? (
                                 <>
                                     <span className="w-5 h-5 border-2 border-white/30 border-t-white rounded-full animate-spin"></span>
-                                    Analyzing Frames & Audio...
+                                    {progress?.status === 'queued'
+                                        ? 'Queued...'
+                                        : progress?.frames_scanned
+                                            ? `Analyzing Frames & Audio (${progress.frames_scanned} frames)...`
+                                            : 'Analyzing Frames & Audio...'}
                                 </>
                             ) : (
                                 <>